@@ -0,0 +1,139 @@
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+
+import synth
+
+# ======================== Benchmark Harness ========================
+# Times each stage of the analysis on one trace and saves the results as
+# JSON, so runs on different commits can be compared:
+#
+#   python bench.py [TRACE] [-o OUT.json] [--compare BASE.json] [--no-plots] [-p N]
+#                   [synth.py options, used when no TRACE is given]
+#
+# Without TRACE, a synthetic trace is generated with synth.write_trace.
+
+def _peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+class _Stages:
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        self.results[name] = {'seconds': round(seconds, 6), 'peak_rss_kb': _peak_rss_kb()}
+        print("> %-16s %9.3fs" % (name, seconds))
+        return result
+
+    # every stage handles each packet of the trace once
+    def set_packets(self, packets):
+        for stage in self.results.values():
+            stage['packets_per_sec'] = round(packets / stage['seconds'], 1) if stage['seconds'] > 0 else None
+
+# plot_workers: processes drawing the plots, see render.start
+def run_benchmark(path, plots=True, plot_workers=None):
+    import perPacket
+    import rtt
+    import trace_parser as parser
+    from flow import FlowList
+    import render
+    from perFlow import writeFlowReports
+
+    stages = _Stages()
+    records = stages.run('parse', lambda: list(parser._parse_tracefile(path, decode=True)))
+    flowLst = FlowList()
+    stages.run('populate', flowLst.populate, records)
+    stages.run('analyze_packets', perPacket.analyze_packets, records)
+    # RTT samples are taken by each flow's rtt.RttTracker during populate; this
+    # stage only gathers and smooths them
+    stages.run('rtt_gather', rtt.computeRtt, flowLst.uniqueFlows['TCP'])
+    if plots:
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            os.makedirs('plots')
+            try:
+                stages.run('plot', lambda: (render.start(plot_workers),
+                                            writeFlowReports(flowLst, 'bench'),
+                                            perPacket.generate_cdf_graphs(),
+                                            perPacket.generate_cdf_header_graphs(),
+                                            render.finish()))
+            finally:
+                os.chdir(cwd)
+
+    packets = len(records)
+    stages.set_packets(packets)
+    return {'commit': _commit(),
+            'python': platform.python_version(),
+            'trace': {'path': os.path.abspath(path), 'bytes': os.path.getsize(path), 'packets': packets},
+            'stages': stages.results,
+            'total_seconds': round(sum(stage['seconds'] for stage in stages.results.values()), 6),
+            'peak_rss_kb': _peak_rss_kb()}
+
+# Print the time of every stage of result next to the one in base
+def compare(result, base):
+    print("%-16s %10s %10s %8s" % ('stage', 'base (s)', 'now (s)', 'ratio'))
+    if base['trace']['packets'] != result['trace']['packets']:
+        print("(traces differ: " + str(base['trace']['packets']) + " vs " + str(result['trace']['packets']) + " packets)")
+    for name, stage in result['stages'].items():
+        if not (name in base['stages']):
+            continue
+        before = base['stages'][name]['seconds']
+        print("%-16s %10.3f %10.3f %7.2fx" % (name, before, stage['seconds'], stage['seconds'] / before if before else 0))
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    output = None
+    if ('-o' in argv):
+        output = argv[argv.index('-o') + 1]
+    base = None
+    if ('--compare' in argv):
+        base = argv[argv.index('--compare') + 1]
+
+    options = synth.parse_options(argv)
+    path = argv[0] if len(argv) > 0 and not argv[0].startswith('-') else None
+    generated = None
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.pcap')
+        os.close(fd)
+        generated = dict(synth.DEFAULTS)
+        generated.update(options)
+        print("> Generating synthetic trace " + json.dumps(generated))
+        synth.write_trace(path, **options)
+
+    try:
+        plot_workers = int(argv[argv.index('-p') + 1]) if '-p' in argv else None
+        result = run_benchmark(path, not ('--no-plots' in argv), plot_workers)
+    finally:
+        if generated is not None:
+            os.remove(path)
+    if generated is not None:
+        result['trace']['synthetic'] = generated
+
+    if output is None:
+        output = 'bench-' + (result['commit'] or 'unknown') + '.json'
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print("> Saved results to '" + output + "'")
+
+    if base is not None:
+        with open(base) as f:
+            compare(result, json.load(f))
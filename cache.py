@@ -0,0 +1,277 @@
+import gc
+import hashlib
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+import decoder
+import ingest
+from flow import Flow, FlowList, TCP_STATES, flowKey
+from rtt import RttTracker
+from sketch import IntHistogram
+
+# ======================== Trace Analysis Cache ========================
+# The FlowList and per-packet Layer results of a trace are saved under
+# CACHE_DIR, one directory of .npy columns (loaded memory-mapped) plus a
+# meta.json per trace and kind. An entry is only used when the trace's path,
+# size, mtime and content hash, the decoder version and CACHE_VERSION all
+# match; anything else counts as a miss and the entry is rebuilt. A trace of
+# several segments (see ingest.trace_segments) is keyed by their total size,
+# latest mtime and the hash of all their contents.
+
+CACHE_DIR = 'cache'
+# Bump whenever the cached layout or the analysis it stores changes
+CACHE_VERSION = 3
+
+_TYPES = ('TCP', 'UDP')
+
+def _trace_key(path, with_hash=True):
+    segments = ingest.trace_segments(path)
+    stats = [os.stat(segment) for segment in segments]
+    key = {'path': os.path.abspath(path), 'size': sum(st.st_size for st in stats),
+           'mtime': max(st.st_mtime_ns for st in stats),
+           'decoder': decoder.DECODER_VERSION, 'version': CACHE_VERSION}
+    if with_hash:
+        digest = hashlib.blake2b()
+        for segment in segments:
+            with open(segment, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        key['hash'] = digest.hexdigest()
+    return key
+
+# Traces with the same name in different directories get their own entries
+def _entry_dir(path, kind):
+    digest = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=4).hexdigest()
+    return os.path.join(CACHE_DIR, os.path.basename(os.path.normpath(path)) + '-' + digest + '.' + kind)
+
+def _load(path, kind):
+    """
+    Return (meta, columns) of a valid cache entry, or None.
+    """
+    entry = _entry_dir(path, kind)
+    try:
+        with open(os.path.join(entry, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # compare the cheap fields before hashing the trace
+    key = _trace_key(path, with_hash=False)
+    stored = meta.get('key', {})
+    if any(stored.get(k) != v for k, v in key.items()):
+        return None
+    if stored.get('hash') != _trace_key(path)['hash']:
+        return None
+
+    columns = {}
+    for name in meta['columns']:
+        columns[name] = np.load(os.path.join(entry, name + '.npy'), mmap_mode='r')
+    return meta, columns
+
+def _save(path, kind, meta, columns):
+    entry = _entry_dir(path, kind)
+    tmp = entry + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp, name + '.npy'), values)
+    meta['key'] = _trace_key(path)
+    meta['columns'] = sorted(columns)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+# ======================== Flows ========================
+
+# Columns of flows, a list of Flows: the per-flow fields, the per-packet arrays
+# of all flows back to back and the RTT samples of the TCP flows
+def flow_columns(flows):
+    counts = np.array([flow.getTotalPackets() for flow in flows], dtype=np.int64)
+
+    # the arrays are joined as bytes, which is much cheaper per flow than numpy
+    def packet_column(name, dtype):
+        return np.frombuffer(b''.join([getattr(flow, name) for flow in flows]), dtype=dtype)
+
+    def flags_column():
+        return np.frombuffer(b''.join([flow.flags for flow in flows if flow.flags is not None]), dtype=np.uint16)
+
+    # RTT samples of the TCP flows; segments still in flight are not kept
+    trackers = [flow.rtt for flow in flows if flow.rtt is not None]
+
+    def rtt_column(name, dtype):
+        return np.frombuffer(b''.join([getattr(tracker, name) for tracker in trackers]), dtype=dtype)
+
+    return {
+        'type': np.array([_TYPES.index(flow.type) for flow in flows], dtype=np.uint8),
+        'src': np.array([flow.nodes[0][0] for flow in flows], dtype=str),
+        'dst': np.array([flow.nodes[1][0] for flow in flows], dtype=str),
+        'sport': np.array([flow.nodes[0][1] for flow in flows], dtype=np.int64),
+        'dport': np.array([flow.nodes[1][1] for flow in flows], dtype=np.int64),
+        'last_sender': np.array([flow.lastSender for flow in flows], dtype=np.int8),
+        'finish_state': np.array([flow.finishState for flow in flows], dtype=np.int8),
+        'finish_req': np.array([flow.finishReq for flow in flows], dtype=np.int8),
+        'reset_state': np.array([flow.resetState for flow in flows], dtype=np.int8),
+        'first_arrival': np.array([flow.firstArrival for flow in flows], dtype=np.float64),
+        'last_arrival': np.array([flow.lastArrival for flow in flows], dtype=np.float64),
+        'total_size': np.array([flow.totalSize for flow in flows], dtype=np.int64),
+        'total_header_size': np.array([flow.totalHeaderSize for flow in flows], dtype=np.int64),
+        'max_inter_arrival': np.array([flow.maxInterArrivalTime for flow in flows], dtype=np.float64),
+        'first_index': np.array([flow.firstIndex for flow in flows], dtype=np.int64),
+        'state': np.array([TCP_STATES.index(flow.state) if flow.state else -1 for flow in flows], dtype=np.int8),
+        'valid': np.array([flow.valid for flow in flows], dtype=bool),
+        'packets': counts,
+        'times': packet_column('times', np.int64),
+        'sizes': packet_column('sizes', np.uint32),
+        'header_sizes': packet_column('headerSizes', np.uint16),
+        'directions': packet_column('directions', np.uint8),
+        'flags': flags_column(),
+        'rtt_counts': np.array([len(tracker.samples) for tracker in trackers], dtype=np.int64),
+        'rtt_samples': rtt_column('samples', np.float64),
+        'rtt_send_times': rtt_column('sendTimes', np.int64),
+        'retransmissions': np.array([tracker.retransmissions for tracker in trackers], dtype=np.int64),
+    }
+
+# Split column into one array of typecode per flow, counts[i] values for flow i
+def _split_column(column, typecode, counts):
+    data = column.tobytes()
+    ends = (np.cumsum(counts) * column.itemsize).tolist()
+    parts = []
+    start = 0
+    for end in ends:
+        parts.append(array(typecode, data[start:end]))
+        start = end
+    return parts
+
+# Rebuild the Flows of columns from flow_columns and add them to flow_list
+def add_flow_columns(flow_list, columns):
+    # Flows hold no reference cycles, and with the collector running it would
+    # rescan every flow built so far many times over
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _add_flow_columns(flow_list, columns)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _add_flow_columns(flow_list, columns):
+    names = ('type', 'src', 'dst', 'sport', 'dport', 'last_sender', 'finish_state', 'finish_req',
+             'reset_state', 'first_arrival', 'last_arrival', 'total_size', 'total_header_size',
+             'max_inter_arrival', 'first_index', 'state', 'valid')
+    counts = columns['packets']
+    tcp_counts = counts[columns['type'] == _TYPES.index('TCP')]
+    flags = iter(_split_column(columns['flags'], 'H', tcp_counts))
+    rtt_samples = iter(_split_column(columns['rtt_samples'], 'd', columns['rtt_counts']))
+    rtt_send_times = iter(_split_column(columns['rtt_send_times'], 'q', columns['rtt_counts']))
+    retransmissions = iter(columns['retransmissions'].tolist())
+    rows = zip(*[columns[name].tolist() for name in names],
+               _split_column(columns['times'], 'q', counts), _split_column(columns['sizes'], 'I', counts),
+               _split_column(columns['header_sizes'], 'H', counts), _split_column(columns['directions'], 'B', counts))
+    for (typ, src, dst, sport, dport, last_sender, finish_state, finish_req, reset_state, first_arrival,
+         last_arrival, total_size, total_header_size, max_inter_arrival, first_index, state, valid,
+         times, sizes, header_sizes, directions) in rows:
+        flow = Flow.__new__(Flow)
+        flow.type = typ = _TYPES[typ]
+        flow.nodes = [(src, sport), (dst, dport)]
+        flow.lastSender = last_sender
+        flow.finishState = finish_state
+        flow.finishReq = finish_req
+        flow.resetState = reset_state
+        flow.firstArrival = first_arrival
+        flow.lastArrival = last_arrival
+        flow.firstIndex = first_index
+        flow.totalSize = total_size
+        flow.totalHeaderSize = total_header_size
+        flow.maxInterArrivalTime = max_inter_arrival
+        flow.state = TCP_STATES[state] if state >= 0 else 0
+        flow.valid = valid
+        flow.times = times
+        flow.sizes = sizes
+        flow.headerSizes = header_sizes
+        flow.directions = directions
+        flow.flags = None
+        flow.rtt = None
+        if typ == 'TCP':
+            flow.flags = next(flags)
+            flow.rtt = RttTracker()
+            flow.rtt.samples = next(rtt_samples)
+            flow.rtt.sendTimes = next(rtt_send_times)
+            flow.rtt.retransmissions = next(retransmissions)
+
+        flow_list.flows[flowKey(typ, flow.nodes[0], flow.nodes[1])] = flow
+        flow_list.uniqueFlows[typ].append(flow)
+        if not valid:
+            flow_list.invalidFlows[typ][flow] = None
+
+def save_flows(path, flow_list):
+    columns = flow_columns(sorted(flow_list.flows.values(), key=lambda flow: flow.firstIndex))
+    for typ in _TYPES:
+        columns['inter_arrivals_' + typ] = np.array(flow_list.interArrivals[typ], dtype=np.float64)
+    meta = {'count': flow_list.count, 'total_bytes': flow_list.totalBytes,
+            'total_packets': flow_list.totalPackets, 'states': flow_list.states}
+    _save(path, 'flows', meta, columns)
+
+# Return the FlowList cached for the trace at path, or None
+def load_flows(path):
+    entry = _load(path, 'flows')
+    if entry is None:
+        return None
+    meta, columns = entry
+
+    flow_list = FlowList()
+    flow_list.count = meta['count']
+    flow_list.totalBytes = meta['total_bytes']
+    flow_list.totalPackets = meta['total_packets']
+    flow_list.states = meta['states']
+    for typ in _TYPES:
+        flow_list.interArrivals[typ] = array('d', columns['inter_arrivals_' + typ].tobytes())
+    add_flow_columns(flow_list, columns)
+    return flow_list
+
+# ======================== Layers ========================
+
+def save_layers(path, layer_list):
+    columns = {}
+    layers = {}
+    for layer_id, layer in layer_list.items():
+        layers[str(layer_id)] = {'total_packets': layer.total_packets, 'total_bytes': layer.total_bytes,
+                                 'counter': layer.packet_types_counter, 'bytes': layer.packet_types_bytes,
+                                 'other': sorted(layer.other_packets)}
+        for t in layer.packet_types:
+            sizes = layer.packet_sizes_list[t]
+            headers = layer.header_sizes_list[t]
+            sizes.flush()
+            headers.flush()
+            columns['sizes_%d_%s' % (layer_id, t)] = sizes.counts
+            columns['headers_%d_%s' % (layer_id, t)] = headers.counts
+    _save(path, 'layers', {'layers': layers}, columns)
+
+def _histogram(counts):
+    histogram = IntHistogram()
+    histogram.counts = np.array(counts, dtype=np.int64)
+    histogram.total = int(np.dot(np.arange(len(counts)), histogram.counts))
+    return histogram
+
+# Fill the freshly created Layers of layer_list ({layer id: Layer}) with the
+# results cached for the trace at path; return False if there are none
+def load_layers(path, layer_list):
+    entry = _load(path, 'layers')
+    if entry is None:
+        return False
+    meta, columns = entry
+
+    for layer_id, layer in layer_list.items():
+        state = meta['layers'][str(layer_id)]
+        layer.total_packets = state['total_packets']
+        layer.total_bytes = state['total_bytes']
+        layer.packet_types_counter = state['counter']
+        layer.packet_types_bytes = state['bytes']
+        layer.other_packets = set(state['other'])
+        for t in layer.packet_types:
+            layer.packet_sizes_list[t] = _histogram(columns['sizes_%d_%s' % (layer_id, t)])
+            layer.header_sizes_list[t] = _histogram(columns['headers_%d_%s' % (layer_id, t)])
+    return True
@@ -0,0 +1,616 @@
+import itertools
+import mmap
+import os
+import select
+import socket
+import stat
+import struct
+import sys
+from time import monotonic, sleep
+
+import numpy as np
+from scapy.all import conf, DNS, PcapReader, RawPcapReader, TCP
+from scapy.utils import EDecimal
+
+# pcap magic number -> (struct byte order, nanoseconds per timestamp fraction tick)
+_PCAP_MAGIC = {b'\xd4\xc3\xb2\xa1': ('<', 1000),
+               b'\xa1\xb2\xc3\xd4': ('>', 1000),
+               b'\x4d\x3c\xb2\xa1': ('<', 1),
+               b'\xa1\xb2\x3c\x4d': ('>', 1)}
+# Bump whenever decoding changes what a PacketRecord holds; invalidates cache.py entries
+DECODER_VERSION = 3
+
+_PCAP_HEADER_LEN = 24
+_RECORD_HEADER_LEN = 16
+# Bytes read at a time when following a capture
+_FOLLOW_CHUNK = 1 << 20
+# Records decoded at a time by read_records
+_DECODE_BATCH = 1024
+
+LINKTYPE_ETHERNET = 1
+
+ETH_IPV4 = 0x0800
+ETH_ARP = 0x0806
+ETH_VLAN = 0x8100
+ETH_IPV6 = 0x86DD
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+_ETHER = struct.Struct('!H')
+_IPV4 = struct.Struct('!BBHHHBB')
+_IPV6 = struct.Struct('!HB')
+_TCP = struct.Struct('!HHIIBB')
+_UDP = struct.Struct('!HHH')
+_PORTS = struct.Struct('!HH')
+_ARP = struct.Struct('!BB')
+
+# Layer name/header size pairs shared by every decoded record
+_ETHERNET_LAYER = ('Ethernet', 14)
+_VLAN_LAYER = ('802.1Q', 4)
+_UDP_LAYER = ('UDP', 8)
+_IPV6_LAYER = ('IPv6', 40)
+
+# Layers past these are never read by the analyses
+_FINAL_LAYERS = ('TCP', 'UDP', 'ICMP', 'ARP')
+
+# ICMP types whose header is longer than the basic 8 bytes
+_ICMP_HEADER_SIZES = {13: 20, 14: 20, 17: 12, 18: 12}
+
+# Ports scapy dissects TCP payloads of into layers of their own, which may
+# have a 'len' field that scapy then sizes a packet without one by (DNS has
+# none)
+_TCP_PAYLOAD_PORTS = frozenset(value for fields, cls in TCP.payload_guess if cls is not DNS
+                               for name, value in fields.items() if name in ('sport', 'dport'))
+
+class PacketRecord:
+    """
+    Lightweight decoded packet, holding only the header fields the
+    analyses read. Field names follow scapy where one exists.
+
+    Instance variables
+    self.time: float
+        capture timestamp in seconds
+    self.time_ns: int
+        the exact capture timestamp in nanoseconds; time differences are
+        taken from it, as the float time rounds to a fraction of a microsecond
+    self.length: int
+        captured length of the frame
+    self.size: int
+        packet size as reported by the per-packet and per-flow statistics
+    self.layers: tuple((str, int))
+        (layer name, header size) for each layer, outermost first
+    self.proto: int
+        protocol number of the IPv4 header; -1 if there is none
+    self.type: str
+        'TCP' or 'UDP' if the packet belongs to a flow; None otherwise
+    self.src, self.dst: str
+        IP addresses of a flow packet
+    self.sport, self.dport: int
+        transport ports of a flow packet
+    self.flags, self.seq, self.ack: int
+        TCP header fields; 0 for UDP
+    self.header_size: int
+        size of all headers up to and including the transport header
+    self.index: int
+        position of the packet in its trace; -1 if unknown
+    self.payload_len: int
+        bytes of TCP segment data, by the IP and TCP length fields; 0 for UDP
+    """
+    __slots__ = ('time', 'time_ns', 'length', 'size', 'layers', 'proto',
+                 'type', 'src', 'dst', 'sport', 'dport', 'flags', 'seq', 'ack',
+                 'header_size', 'index', 'payload_len')
+
+    def __init__(self, time_ns, length, size, layers, proto=-1, typ=None,
+                 src=None, dst=None, sport=0, dport=0, flags=0, seq=0, ack=0,
+                 header_size=0, index=-1, payload_len=0):
+        self.time = time_ns / 1000000000
+        self.time_ns = time_ns
+        self.length = length
+        self.size = size
+        self.layers = layers
+        self.proto = proto
+        self.type = typ
+        self.src = src
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.flags = flags
+        self.seq = seq
+        self.ack = ack
+        self.header_size = header_size
+        self.index = index
+        self.payload_len = payload_len
+
+# ============================ Fast Path ============================
+
+# Decode an Ethernet frame at buf[start:start + caplen].
+# Return None if the frame needs a full scapy dissection.
+def decode_ethernet(buf, start, caplen, time_ns):
+    end = start + caplen
+    off = start + 14
+    if off > end:
+        return None
+    etype = _ETHER.unpack_from(buf, start + 12)[0]
+    layers = [_ETHERNET_LAYER]
+    while etype == ETH_VLAN:
+        if off + 4 > end:
+            return None
+        layers.append(_VLAN_LAYER)
+        etype = _ETHER.unpack_from(buf, off + 2)[0]
+        off += 4
+    # scapy reports the size up to the second layer plus the first 'len' field
+    l2_size = layers[0][1] + layers[1][1] if len(layers) > 1 else 0
+
+    if etype == ETH_IPV4:
+        if off + 20 > end:
+            return None
+        vihl, _, ip_len, _, frag, _, proto = _IPV4.unpack_from(buf, off)
+        ihl = (vihl & 0x0F) * 4
+        if vihl >> 4 != 4 or ihl < 20 or off + ihl > end or frag & 0x1FFF:
+            return None
+        layers.append(('IPv4', ihl))
+        if len(layers) == 2:
+            l2_size = 14 + ihl
+        src = socket.inet_ntoa(buf[off + 12:off + 16])
+        dst = socket.inet_ntoa(buf[off + 16:off + 20])
+        size = l2_size + ip_len
+        header_size = off - start + ihl
+        off += ihl
+        if proto == PROTO_TCP:
+            return _decode_tcp(buf, off, end, time_ns, caplen, size, layers,
+                               proto, src, dst, header_size, ip_len - ihl)
+        if proto == PROTO_UDP:
+            return _decode_udp(buf, off, end, time_ns, caplen, size, layers,
+                               proto, src, dst, header_size, ip_len - ihl)
+        if proto == PROTO_ICMP:
+            if off + 4 > end:
+                return None
+            icmp_type = buf[off]
+            if icmp_type > 18:
+                return None
+            icmp_len = _ICMP_HEADER_SIZES.get(icmp_type, 8)
+            if off + icmp_len > end or ip_len - ihl < icmp_len:
+                return None
+            layers.append(('ICMP', icmp_len))
+            return PacketRecord(time_ns, caplen, size, tuple(layers), proto)
+        return None
+
+    if etype == ETH_IPV6:
+        if off + 40 > end:
+            return None
+        plen, nh = _IPV6.unpack_from(buf, off + 4)
+        if buf[off] >> 4 != 6 or not (nh == PROTO_UDP or nh == PROTO_TCP):
+            return None
+        layers.append(_IPV6_LAYER)
+        src = socket.inet_ntop(socket.AF_INET6, buf[off + 8:off + 24])
+        dst = socket.inet_ntop(socket.AF_INET6, buf[off + 24:off + 40])
+        header_size = off - start + 40
+        off += 40
+        if nh == PROTO_TCP:
+            # no header of the packet has a 'len' field, so scapy sizes it by
+            # the whole frame
+            if off + 4 > end:
+                return None
+            sport, dport = _PORTS.unpack_from(buf, off)
+            if sport in _TCP_PAYLOAD_PORTS or dport in _TCP_PAYLOAD_PORTS:
+                return None
+            return _decode_tcp(buf, off, end, time_ns, caplen, caplen, layers,
+                               -1, src, dst, header_size, plen)
+        if off + 8 > end:
+            return None
+        udp_len = _UDP.unpack_from(buf, off)[2]
+        size = (l2_size if len(layers) > 2 else 54) + udp_len
+        return _decode_udp(buf, off, end, time_ns, caplen, size, layers,
+                           -1, src, dst, header_size, plen)
+
+    if etype == ETH_ARP:
+        if off + 6 > end:
+            return None
+        hwlen, plen = _ARP.unpack_from(buf, off + 4)
+        arp_len = 8 + 2 * hwlen + 2 * plen
+        if off + arp_len > end:
+            return None
+        layers.append(('ARP', arp_len))
+        return PacketRecord(time_ns, caplen, caplen, tuple(layers))
+
+    return None
+
+def _decode_tcp(buf, off, end, time_ns, caplen, size, layers, proto, src, dst,
+                header_size, payload_len):
+    if off + 20 > end:
+        return None
+    sport, dport, seq, ack, offres, flags = _TCP.unpack_from(buf, off)
+    tcp_len = (offres >> 4) * 4
+    if tcp_len < 20 or off + tcp_len > end or payload_len < tcp_len:
+        return None
+    layers.append(('TCP', tcp_len))
+    return PacketRecord(time_ns, caplen, size, tuple(layers), proto, 'TCP',
+                        src, dst, sport, dport, ((offres & 1) << 8) | flags,
+                        seq, ack, header_size + tcp_len, -1, payload_len - tcp_len)
+
+def _decode_udp(buf, off, end, time_ns, caplen, size, layers, proto, src, dst,
+                header_size, payload_len):
+    if off + 8 > end or payload_len < 8:
+        return None
+    sport, dport, _ = _UDP.unpack_from(buf, off)
+    layers.append(_UDP_LAYER)
+    return PacketRecord(time_ns, caplen, size, tuple(layers), proto, 'UDP',
+                        src, dst, sport, dport, 0, 0, 0, header_size + 8)
+
+# ============================ scapy Fallback ============================
+
+def _get_packet_name(pkt):
+    name = pkt.name
+    if name == 'IP':
+        name += 'v' + str(pkt.version)
+    return name
+
+# lengths[i] is len() of the i-th layer of packet, outermost first
+def _compute_packet_size(packet, lengths):
+    try:
+        size_field = packet.len
+    except AttributeError:
+        return lengths[0]
+    below = lengths[2] if len(lengths) > 2 else len(packet.payload.payload)
+    return lengths[0] - below + size_field
+
+# Build a PacketRecord from a dissected scapy packet.
+# len() of a scapy layer builds the bytes of the layer and every layer below
+# it, so it is taken once per layer and the header sizes are derived from
+# the lengths of consecutive layers.
+def from_packet(packet):
+    layers = []
+    proto = -1
+    pkt_layer = packet
+    lengths = [len(packet)]
+    while pkt_layer:
+        name = _get_packet_name(pkt_layer)
+        lengths.append(len(pkt_layer.payload))
+        layers.append((name, lengths[-2] - lengths[-1]))
+        if name == 'IPv4' and proto == -1:
+            proto = pkt_layer.proto
+        if name in _FINAL_LAYERS:
+            break
+        pkt_layer = pkt_layer.payload
+
+    record = PacketRecord(round(packet.time * 1000000000), lengths[0],
+                          _compute_packet_size(packet, lengths), tuple(layers), proto)
+
+    if not (packet.haslayer('TCP') or packet.haslayer('UDP')):
+        return record
+    if packet.haslayer('IP'):
+        ip = packet['IP']
+    elif packet.haslayer('IPv6'):
+        ip = packet['IPv6']
+    else:
+        return record
+    typ = 'TCP' if packet.haslayer('TCP') else 'UDP'
+    transport = packet[typ]
+
+    record.type = typ
+    record.src = ip.src
+    record.dst = ip.dst
+    record.sport = transport.sport
+    record.dport = transport.dport
+    if typ == 'TCP':
+        record.flags = int(transport.flags)
+        record.seq = transport.seq
+        record.ack = transport.ack
+        ip_payload = ip.len - ip.ihl * 4 if ip.version == 4 else ip.plen
+        if not (ip.payload is transport):
+            # IPv6 extension headers
+            ip_payload -= len(ip.payload) - len(transport)
+        record.payload_len = max(0, ip_payload - transport.dataofs * 4)
+    if transport is pkt_layer:
+        record.header_size = lengths[0] - lengths[-1]
+    else:
+        record.header_size = lengths[0] - len(transport.payload)
+    return record
+
+def as_record(packet):
+    if isinstance(packet, PacketRecord):
+        return packet
+    return from_packet(packet)
+
+def _decode_with_scapy(data, linktype, time_ns):
+    cls = conf.l2types.get(linktype, conf.raw_layer)
+    packet = cls(data)
+    packet.time = EDecimal(time_ns) / 1000000000
+    return from_packet(packet)
+
+# ============================ Flow Sharding ============================
+
+# A raw captured frame, split from its trace but not decoded yet
+class Frame:
+    __slots__ = ('time_ns', 'linktype', 'data', 'index')
+
+    def __init__(self, time_ns, linktype, data, index):
+        self.time_ns = time_ns
+        self.linktype = linktype
+        self.data = data
+        self.index = index
+
+# Shard of a frame that cannot belong to a flow, and of one whose flow is not
+# clear without decoding it
+NOT_FLOW = -1
+UNKNOWN = -2
+
+# IP protocols that never carry a TCP/UDP header
+_NON_FLOW_PROTOS = (1, 2, 50, 51, 58, 89, 103, 112, 132)
+
+_MASK64 = (1 << 64) - 1
+_HASH_MUL = 0x9e3779b97f4a7c15
+
+# splitmix64 finalizer, for numpy uint64 arrays and for ints alike
+def _mix(x):
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+# Shard out of count of every frame buf[starts[i]:starts[i] + caplens[i]],
+# read with numpy straight from the frame bytes; NOT_FLOW or UNKNOWN where
+# there is no flow to hash. buf is a numpy uint8 array and linktypes an
+# array with the link type of every frame.
+#
+# The hash does not depend on the direction of the packet, so all packets of
+# a flow land in the same shard; record_shard gives the same shard for the
+# decoded packet.
+def frame_shards(buf, starts, caplens, linktypes, count):
+    starts = np.asarray(starts, dtype=np.int64)
+    end = starts + np.asarray(caplens, dtype=np.int64)
+    shards = np.full(len(starts), UNKNOWN, dtype=np.int64)
+
+    def byte(pos):
+        return buf.take(pos, mode='clip').astype(np.int64)
+
+    def u16(pos):
+        return byte(pos) << 8 | byte(pos + 1)
+
+    off = starts + 14
+    ok = (np.asarray(linktypes) == LINKTYPE_ETHERNET) & (off <= end)
+    etype = np.where(ok, u16(starts + 12), 0)
+    while True:
+        vlan = ok & (etype == ETH_VLAN)
+        if not vlan.any():
+            break
+        ok &= ~(vlan & (off + 4 > end))
+        vlan &= ok
+        etype = np.where(vlan, u16(off + 2), etype)
+        off = np.where(vlan, off + 4, off)
+    shards[ok & (etype == ETH_ARP)] = NOT_FLOW
+
+    v4 = ok & (etype == ETH_IPV4) & (off + 20 <= end)
+    vihl = byte(off)
+    ihl = (vihl & 0x0F) * 4
+    v4 &= (vihl >> 4 == 4) & (ihl >= 20)
+    fragment = v4 & ((u16(off + 6) & 0x1FFF) != 0)
+    shards[fragment] = NOT_FLOW # non-first fragments have no transport header
+    v4 &= ~fragment
+    v6 = ok & (etype == ETH_IPV6) & (off + 40 <= end)
+
+    proto = np.where(v4, byte(off + 9), byte(off + 6))
+    transport = np.where(v4, off + ihl, off + 40)
+    ip = v4 | v6
+    shards[ip & np.isin(proto, _NON_FLOW_PROTOS)] = NOT_FLOW
+    tcp = ip & (proto == PROTO_TCP) & (transport + 20 <= end)
+    udp = ip & (proto == PROTO_UDP) & (transport + 8 <= end)
+    flows = np.flatnonzero(tcp | udp)
+    if len(flows) == 0:
+        return shards
+
+    addr = np.where(v4, off + 12, off + 8)[flows]
+    addr_len = np.where(v4, 4, 16)[flows]
+    transport = transport[flows]
+    words = addr_len // 4
+
+    def endpoint(addr, port):
+        x = np.zeros(len(flows), dtype=np.uint64)
+        for k in range(4):
+            pos = addr + 4 * k
+            word = (byte(pos) << 24 | byte(pos + 1) << 16 | byte(pos + 2) << 8 | byte(pos + 3)).astype(np.uint64)
+            x = np.where(k < words, (x ^ word) * np.uint64(_HASH_MUL), x)
+        return _mix((x ^ u16(port).astype(np.uint64)) * np.uint64(_HASH_MUL))
+
+    flow_hash = _mix(endpoint(addr, transport) + endpoint(addr + addr_len, transport + 2)
+                     + proto[flows].astype(np.uint64))
+    shards[flows] = (flow_hash % np.uint64(count)).astype(np.int64)
+    return shards
+
+def _endpoint_hash(host, port):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    address = socket.inet_pton(family, host)
+    x = 0
+    for word in struct.unpack('!%dI' % (len(address) // 4), address):
+        x = ((x ^ word) * _HASH_MUL) & _MASK64
+    return _mix(((x ^ port) * _HASH_MUL) & _MASK64)
+
+# Shard out of count of a decoded record; the same as frame_shards gives for
+# its frame, and NOT_FLOW for a record that is not TCP/UDP
+def record_shard(record, count):
+    if record.type is None:
+        return NOT_FLOW
+    proto = PROTO_TCP if record.type == 'TCP' else PROTO_UDP
+    flow_hash = _mix((_endpoint_hash(record.src, record.sport) + _endpoint_hash(record.dst, record.dport)
+                      + proto) & _MASK64)
+    return flow_hash % count
+
+def _decode_frame(buf, start, caplen, time_ns, linktype):
+    record = None
+    if linktype == LINKTYPE_ETHERNET:
+        record = decode_ethernet(buf, start, caplen, time_ns)
+    if record is None:
+        record = _decode_with_scapy(bytes(buf[start:start + caplen]), linktype, time_ns)
+    return record
+
+def decode_frame(frame):
+    record = _decode_frame(frame.data, 0, len(frame.data), frame.time_ns, frame.linktype)
+    record.index = frame.index
+    return record
+
+# Decode the frames buf[start:start + caplen] of the (start, caplen, time_ns)
+# tuples of frames, numbered by indices
+def decode_frames(buf, frames, linktypes, indices):
+    records = []
+    for (start, caplen, time_ns), linktype, index in zip(frames, linktypes, indices):
+        record = None
+        if linktype == LINKTYPE_ETHERNET:
+            record = decode_ethernet(buf, start, caplen, time_ns)
+        if record is None:
+            record = _decode_with_scapy(bytes(buf[start:start + caplen]), linktype, time_ns)
+        record.index = index
+        records.append(record)
+    return records
+
+# ============================ Trace Readers ============================
+
+# Yield a PacketRecord for every packet in the trace at path.
+# Classic pcap files are decoded straight from an mmap of the file; frames the
+# fast path does not understand are handed to scapy. Anything else (e.g.
+# pcapng) is read through scapy entirely.
+def read_records(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        if not (magic in _PCAP_MAGIC):
+            for record in _iter_scapy(path):
+                yield record
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(buf)
+    try:
+        for record in _iter_pcap(view):
+            yield record
+    finally:
+        view.release()
+        buf.close()
+
+def _iter_scapy(path):
+    index = 0
+    for packet in PcapReader(path):
+        record = from_packet(packet)
+        record.index = index
+        index += 1
+        yield record
+
+# Yield a Frame for every packet of a capture that is not classic pcap
+# (e.g. pcapng), split by scapy without dissecting it
+def _iter_raw_scapy(path):
+    index = 0
+    for data, meta in RawPcapReader(path):
+        time_ns = 0 # simple packet blocks carry no timestamp
+        if meta.tshigh is not None:
+            time_ns = ((meta.tshigh << 32) + meta.tslow) * 1000000000 // meta.tsresol
+        yield Frame(time_ns, meta.linktype, data, index)
+        index += 1
+
+def _iter_pcap(view):
+    header = _read_pcap_header(view)
+    off = _PCAP_HEADER_LEN
+    index = 0
+    while True:
+        records, off, index = _decode_pcap_records(view, off, header, index, _DECODE_BATCH)
+        if len(records) == 0:
+            return # end of the file, or a truncated final record
+        yield from records
+
+# ============================ Follow Mode ============================
+
+# Follow a classic pcap capture that is still being written, like tail -f.
+# source is a path, or '-' for stdin (e.g. tcpdump -w - | ...).
+#
+# Yields a list of the PacketRecords that became available since the last
+# list; an empty list is yielded every poll_interval seconds while no new
+# packets arrive, so the caller can act on time passing. A pipe is followed
+# until the writer closes it; a file until no data has arrived for
+# idle_timeout seconds (forever if None). A partly written record is kept
+# until the rest of it arrives.
+def follow_batches(source, poll_interval=0.1, idle_timeout=None):
+    if source == '-':
+        f = None
+        fd = sys.stdin.buffer.fileno()
+    else:
+        f = open(source, 'rb')
+        fd = f.fileno()
+    regular = stat.S_ISREG(os.fstat(fd).st_mode)
+    try:
+        pending = b''
+        header = None
+        index = 0
+        last_data = monotonic()
+        while True:
+            chunk = b''
+            if regular:
+                chunk = os.read(fd, _FOLLOW_CHUNK)
+            elif select.select([fd], [], [], poll_interval)[0]:
+                chunk = os.read(fd, _FOLLOW_CHUNK)
+                if not chunk:
+                    break # the writer closed the pipe
+            if not chunk:
+                if idle_timeout is not None and monotonic() - last_data >= idle_timeout:
+                    break
+                if regular:
+                    sleep(poll_interval)
+                yield []
+                continue
+            last_data = monotonic()
+
+            data = pending + chunk
+            off = 0
+            if header is None:
+                if len(data) < _PCAP_HEADER_LEN:
+                    pending = data
+                    continue
+                header = _read_pcap_header(data)
+                off = _PCAP_HEADER_LEN
+            records, off, index = _decode_pcap_records(memoryview(data), off, header, index)
+            pending = data[off:]
+            yield records
+    finally:
+        if f is not None:
+            f.close()
+
+def _read_pcap_header(data):
+    magic = bytes(data[:4])
+    if not (magic in _PCAP_MAGIC):
+        raise ValueError("Only classic pcap captures can be followed.")
+    endian, tick = _PCAP_MAGIC[magic]
+    linktype = struct.unpack_from(endian + 'I', data, 20)[0]
+    return struct.Struct(endian + 'IIII'), tick, linktype
+
+# Yield (start, caplen, time_ns) for the complete records of view from off on,
+# start being the offset of the frame; stops at the first incomplete record.
+# The one place pcap record headers are read.
+def _pcap_records(view, off, header):
+    record_header, tick, _ = header
+    unpack_from = record_header.unpack_from
+    end = len(view)
+    while off + _RECORD_HEADER_LEN <= end:
+        sec, frac, caplen, _ = unpack_from(view, off)
+        start = off + _RECORD_HEADER_LEN
+        off = start + caplen
+        if off > end:
+            return
+        yield start, caplen, sec * 1000000000 + frac * tick
+
+# Decode the complete records of view from off on, at most limit of them;
+# return them with the offset of the first record left and the next packet index
+def _decode_pcap_records(view, off, header, index, limit=None):
+    frames = list(itertools.islice(_pcap_records(view, off, header), limit))
+    if len(frames) == 0:
+        return [], off, index
+    records = decode_frames(view, frames, itertools.repeat(header[2]), range(index, index + len(frames)))
+    start, caplen, _ = frames[-1]
+    return records, start + caplen, index + len(frames)
+
+# Split the complete records of view from off on into Frames without decoding
+# them; the same contract as _decode_pcap_records
+def _read_pcap_frames(view, off, header, index, limit=None):
+    linktype = header[2]
+    frames = []
+    for start, caplen, time_ns in itertools.islice(_pcap_records(view, off, header), limit):
+        frames.append(Frame(time_ns, linktype, bytes(view[start:start + caplen]), index))
+        index += 1
+        off = start + caplen
+    return frames, off, index
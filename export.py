@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import sys
+
+import rtt
+
+# ======================== Flow Export ========================
+# Writes one row per flow of a FlowList to an SQLite database, so questions
+# about a trace can be answered with SQL instead of parsing it again:
+#
+#   python export.py FLOWS.db "SELECT src, count(*) FROM flows GROUP BY src"
+#
+# Times are seconds since the epoch (first_arrival, last_arrival) or ms
+# (duration_ms, rtt_*_ms). The rtt_* columns summarize the RTT samples of
+# TCP flows (see rtt.summarizeRtt) and are NULL for UDP flows and flows
+# without samples; retransmissions counts the segments of a TCP flow that
+# resent sequence space. Flows evicted from the FlowList are not exported.
+
+# Flows inserted per executemany call
+BATCH_SIZE = 10000
+
+_COLUMNS = (("type", "TEXT"), ("src", "TEXT"), ("sport", "INTEGER"), ("dst", "TEXT"), ("dport", "INTEGER"),
+            ("first_arrival", "REAL"), ("last_arrival", "REAL"), ("duration_ms", "REAL"),
+            ("packets", "INTEGER"), ("bytes", "INTEGER"), ("header_bytes", "INTEGER"), ("overhead", "REAL"),
+            ("state", "TEXT"), ("valid", "INTEGER"),
+            ("rtt_samples", "INTEGER"), ("rtt_min_ms", "REAL"), ("rtt_median_ms", "REAL"),
+            ("rtt_mean_ms", "REAL"), ("rtt_max_ms", "REAL"), ("rtt_srtt_ms", "REAL"),
+            ("retransmissions", "INTEGER"))
+
+_INDEXES = (("flows_src", "src, sport"), ("flows_dst", "dst, dport"),
+            ("flows_first_arrival", "first_arrival"), ("flows_type_state", "type, state"))
+
+def _real(value):
+    # NaN marks a missing RTT summary
+    return None if value != value else float(value)
+
+def _rows(flows, summary):
+    for i in range(len(flows)):
+        flow = flows[i]
+        row = (flow.type, str(flow.nodes[0][0]), int(flow.nodes[0][1]), str(flow.nodes[1][0]), int(flow.nodes[1][1]),
+               float(flow.firstArrival), float(flow.lastArrival), float(flow.getDuration()),
+               flow.getTotalPackets(), int(flow.totalSize), int(flow.totalHeaderSize), float(flow.getOverheadRatio()),
+               flow.state if flow.type == "TCP" else None, int(bool(flow.valid)))
+        if summary is None or summary["samples"][i] == 0:
+            row += (0 if summary is not None else None, None, None, None, None, None)
+        else:
+            row += (int(summary["samples"][i]), _real(summary["min"][i]), _real(summary["median"][i]),
+                    _real(summary["mean"][i]), _real(summary["max"][i]), _real(summary["srtt"][i]))
+        yield row + (flow.rtt.retransmissions if flow.rtt is not None else None,)
+
+# Write the flows of flowLst to a new SQLite database at path, replacing any
+# existing one, and return the number of rows. trace is stored in the meta
+# table as the name of the capture the flows came from.
+def export_flows(flow_list, path, trace=None):
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        # a half-written database is discarded, so it needs no journal
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE flows (id INTEGER PRIMARY KEY, "
+                   + ", ".join(name + " " + kind for name, kind in _COLUMNS) + ")")
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        insert = ("INSERT INTO flows (" + ", ".join(name for name, _ in _COLUMNS) + ") VALUES ("
+                  + ", ".join("?" for _ in _COLUMNS) + ")")
+
+        flow_list.flushEvictions()
+        rows = 0
+        for typ in ("TCP", "UDP"):
+            flows = flow_list.uniqueFlows[typ]
+            for start in range(0, len(flows), BATCH_SIZE):
+                batch = flows[start:start + BATCH_SIZE]
+                summary = rtt.summarizeRtt(batch) if typ == "TCP" else None
+                db.executemany(insert, _rows(batch, summary))
+                rows += len(batch)
+
+        # indexes are cheaper to build once the rows are in
+        for name, columns in _INDEXES:
+            db.execute("CREATE INDEX " + name + " ON flows (" + columns + ")")
+        db.executemany("INSERT INTO meta VALUES (?, ?)",
+                       [("trace", trace), ("flows", str(rows)),
+                        ("evicted_tcp", str(flow_list.count["TCP"] - len(flow_list.uniqueFlows["TCP"]))),
+                        ("evicted_udp", str(flow_list.count["UDP"] - len(flow_list.uniqueFlows["UDP"])))])
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp, path)
+    return rows
+
+# Run sql against the database at path and return its rows
+def query(path, sql, params=()):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute(sql, params).fetchall()
+    finally:
+        db.close()
+
+if __name__ == '__main__':
+    for row in query(sys.argv[1], sys.argv[2]):
+        print("\t".join(str(value) for value in row))
@@ -1,4 +1,17 @@
-from scapy.all import *
+from array import array
+from collections import defaultdict
+import heapq
+
+import numpy as np
+
+import decoder
+import rtt
+from sketch import LogHistogram
+
+TCP_STATES = ("Request", "Reset", "Finished", "Ongoing", "Failed")
+# States of TCP flows that were closed by FIN or RST
+COMPLETED_STATES = ("Reset", "Finished")
+FLOW_METRICS = ("duration", "packets", "size", "overhead")
 
 FIN = 0x01
 SYN = 0x02
@@ -6,35 +19,19 @@ RST = 0x04
 PSH = 0x08
 ACK = 0x10
 
-def _compute_packet_size(packet):
-    try:
-        return len(packet) - len(packet.payload.payload) + packet.len
-    except AttributeError:
-        return len(packet)
-
 class Flow:
+    __slots__ = ("nodes", "lastSender", "finishState", "finishReq", "resetState",
+                 "type", "firstArrival", "lastArrival", "times", "sizes",
+                 "headerSizes", "directions", "flags", "rtt",
+                 "totalSize", "totalHeaderSize", "maxInterArrivalTime", "firstIndex",
+                 "state", "valid")
+
     def __init__(self, packet):
-        ip = ""
-        try:
-            ip = packet[IP]
-        except IndexError:
-            ip = packet[IPv6]
-        except:
-            raise ValueError("Packet must contain an IP/IPv6 header")
-
-        transport = ""
-        typ = ""
-
-        try:
-            transport = packet[TCP]
-            typ = "TCP"
-        except IndexError:
-            transport = packet[UDP]
-            typ = "UDP"
-        except:
-            raise ValueError("Packet must contain a TCP/UDP header.")
-        
-        self.nodes = [(ip.src, transport.sport), (ip.dst, transport.dport)]
+        packet = decoder.as_record(packet)
+        if (packet.type is None):
+            raise ValueError("Packet must contain an IP/IPv6 header and a TCP/UDP header.")
+
+        self.nodes = [(packet.src, packet.sport), (packet.dst, packet.dport)]
 
         # ---- Senders are either 0 or 1 (self.nodes[0] or self.nodes[1])
         # The last sender is the src of packet; this variable alternates depending on direction
@@ -45,77 +42,68 @@ class Flow:
         self.finishReq = -1
         self.resetState = 0
 
-        self.type = typ
+        self.type = packet.type
         self.firstArrival = packet.time
         self.lastArrival = packet.time
-        
-        # Each element in this list is (packet, interArrivalTime)
-        self.packets = [(packet, 0)]
-        self.ackPacketMap = {}
+        # Position of the flow's first packet in the trace
+        self.firstIndex = packet.index
+
+        # ---- Per-packet columns; element i of each column describes packet i.
+        # Times are the exact timestamps in ns, so durations and inter-arrival
+        # times are exact differences
+        self.times = array("q")
+        self.sizes = array("I")
+        self.headerSizes = array("H")
+        self.directions = array("B")
+        # TCP flags are only kept for TCP flows, whose RTT is tracked as
+        # their packets are added
+        self.flags = None
+        self.rtt = None
+        if (self.type == "TCP"):
+            self.flags = array("H")
+            self.rtt = rtt.RttTracker()
+        self._appendPacket(packet)
         self.updateState()
         
-        self.totalSize = _compute_packet_size(packet)
-        self.totalHeaderSize = len(packet) - len(packet[self.type].payload)
+        self.totalSize = packet.size
+        self.totalHeaderSize = packet.header_size
         self.maxInterArrivalTime = 0
+        self.valid = True
 
-    def getRttPacketPairs(self):
-        packetPair = {} # int -> int: maps packet index to packet index
-        unpairedPackets = {} # int -> int: ack -> packet
-        for i in range(len(self.packets)):
-            # packet isn't paired yet
-            packetPair[i] = -1
-            pkt = self.packets[i][0]
-            unpairedPackets[pkt.ack] = i
-            # find packet it's acknowledging
-            seekingAck = pkt.seq
-            if seekingAck in unpairedPackets: # It's a match
-                pairPktInd = unpairedPackets[seekingAck]
-                pairPkt = self.packets[pairPktInd][0]
-                # if packet same direction
-                if pairPkt.src == pkt.src:
-                    continue
-                packetPair[pairPktInd]  = i
-                del unpairedPackets[seekingAck]
-        return packetPair
+    def _appendPacket(self, packet):
+        self.times.append(packet.time_ns)
+        self.sizes.append(packet.size)
+        self.headerSizes.append(packet.header_size)
+        self.directions.append(self.lastSender)
+        if (self.flags is not None):
+            self.flags.append(packet.flags)
+            self.rtt.add(self.lastSender, packet.time_ns, packet.flags, packet.seq, packet.ack, packet.payload_len)
 
     def addPacket(self, packet):
-        p = (packet, packet.time - self.lastArrival)
-        self.maxInterArrivalTime = max(self.maxInterArrivalTime, p[1])
+        packet = decoder.as_record(packet)
+        interArrivalTime = (packet.time_ns - self.times[-1]) / 1000000000
+        if (interArrivalTime > self.maxInterArrivalTime):
+            self.maxInterArrivalTime = interArrivalTime
+            self.valid = self.maxInterArrivalTime <= 90 * 60
         self.lastArrival = packet.time
 
-        self.packets.append(p)
-        self.totalSize += _compute_packet_size(packet)
-        self.totalHeaderSize += len(packet) - len(packet[self.type].payload)
+        self.totalSize += packet.size
+        self.totalHeaderSize += packet.header_size
 
         # Check direction of flow
-        ip = ""
-        try:
-            ip = packet[IP]
-        except IndexError:
-            ip = packet[IPv6]
-        except:
-            raise ValueError("Packet must contain an IP/IPv6 header")
-
-        transport = ""
-        try:
-            transport = packet[TCP]
-        except IndexError:
-            transport = packet[UDP]
-        except:
-            raise ValueError("Packet must contain a TCP/UDP header.")
-
-        if ((ip.src, transport.sport) == self.nodes[0]):
+        if ((packet.src, packet.sport) == self.nodes[0]):
             self.lastSender = 0
         else:
             self.lastSender = 1
 
+        self._appendPacket(packet)
         self.updateState()
 
     def getDuration(self):
-        return (self.lastArrival - self.firstArrival) * 1000
+        return (self.times[-1] - self.times[0]) / 1000000
 
     def getTotalPackets(self):
-        return len(self.packets)
+        return len(self.times)
 
     def getTotalSize(self):
         return self.totalSize
@@ -127,12 +115,18 @@ class Flow:
             return 9999
 
     def getInterArrivalTimes(self):
-        return [(p[1] * 1000) for p in self.packets]
+        times = self.times
+        return [0] + [((times[i] - times[i - 1]) / 1000000) for i in range(1, len(times))]
 
+    # The state only changes when a packet arrives, so it is kept up to date
+    # by updateState rather than computed on every call
     def getState(self):
+        return self.state
+
+    def _computeState(self):
         if (self.type == "TCP"):
-            flag = self.packets[-1][0][TCP].flags
-            threshold = (self.lastArrival - self.firstArrival) <= 5 * 60
+            flag = self.flags[-1]
+            threshold = (self.times[-1] - self.times[0]) <= 5 * 60 * 1000000000
             if (flag & SYN):
                 if (threshold):
                     return "Request"
@@ -151,7 +145,7 @@ class Flow:
 
     def updateState(self):
         if (self.type == "TCP"):
-            flag = self.packets[-1][0][TCP].flags
+            flag = self.flags[-1]
             if (flag & FIN):
                 if (self.finishState == 0):
                     self.finishState = 1
@@ -160,116 +154,466 @@ class Flow:
                     self.finishState = 2
             if (flag & RST):
                 self.resetState = 1
+        self.state = self._computeState()
 
     def isValid(self):
-        return self.maxInterArrivalTime <= 90 * 60
+        return self.valid
+
+# Direction-independent key of the flow between nodes (IP, port) a and b
+def flowKey(typ, a, b):
+    if (a <= b):
+        return (typ, a, b)
+    return (typ, b, a)
+
+# ==================== Top Flows ====================
+
+def _medianRtts(flows):
+    return [np.median(data[0]) * 1000 if len(data[0]) > 0 else -np.inf for data in rtt.computeRtt(flows)]
+
+# Metrics flows can be ranked by: name -> function returning the value of each
+# of a list of flows. duration and rtt (median RTT sample) are in ms; flows
+# without an RTT sample rank last.
+TOP_METRICS = {"packets": lambda flows: [flow.getTotalPackets() for flow in flows],
+               "bytes": lambda flows: [flow.totalSize for flow in flows],
+               "duration": lambda flows: [flow.getDuration() for flow in flows],
+               "rtt": _medianRtts}
+
+# Return the k flows with the largest metric as a list of (value, flow), largest
+# first. metric is a name in TOP_METRICS or a function of one Flow. Flows with
+# equal values keep their order in flows. This is one pass over the flows with
+# a heap of k entries (heapq.nlargest).
+def topFlows(flows, metric, k):
+    if (callable(metric)):
+        values = [metric(flow) for flow in flows]
+    else:
+        values = TOP_METRICS[metric](flows)
+    top = heapq.nlargest(k, range(len(flows)), key=values.__getitem__)
+    return [(values[i], flows[i]) for i in top]
+
+# Return the k host pairs with the most flows between them as a list of
+# (count, (IP1, IP2), list(Flow)), largest first; pairs with equal counts keep
+# the order of their first flow.
+def topHostPairs(flows, k):
+    pairs = defaultdict(list)
+    for flow in flows:
+        pairs[hostPair(flow.nodes[0][0], flow.nodes[1][0])].append(flow)
+    return _topPairs(pairs, k)
+
+# pairs: sorted (IP1, IP2) -> list(Flow)
+def _topPairs(pairs, k):
+    top = heapq.nlargest(k, pairs.values(), key=len)
+    # a pair is named in the direction of its first flow
+    return [(len(pairFlows), (pairFlows[0].nodes[0][0], pairFlows[0].nodes[1][0]), pairFlows) for pairFlows in top]
+
+# Direction-independent key of the hosts a and b
+def hostPair(a, b):
+    if (a <= b):
+        return (a, b)
+    return (b, a)
+
+# A copy of sketch with values added
+def _withValues(sketch, values):
+    sketch = sketch.copy()
+    sketch.extend(values)
+    return sketch
 
 class FlowList:
-    def __init__(self):
-        self.flows = {"TCP": {}, "UDP": {}}
+    # With sketch=True, the inter-arrival times are accumulated in LogHistogram
+    # sketches instead of one value per packet; see sketch.LogHistogram for the error bound
+    #
+    # Flows can be evicted once they time out, so a long capture only needs memory
+    # for the flows that are open at the same time: with any timeout set, the
+    # inter-arrival times and the metrics of evicted flows are kept in
+    # LogHistogram sketches as with sketch=True. Timeouts are in seconds of
+    # packet time and are off (None) by default:
+    #   idleTimeout   - no packet for this long
+    #   activeTimeout - this long since the flow's first packet
+    #   finishTimeout - no packet for this long after a TCP flow was Finished or Reset
+    # An evicted flow keeps its place in count, bytes, states and the flow metrics,
+    # but is dropped from flows and uniqueFlows; a later packet with the same
+    # endpoints starts a new flow.
+    def __init__(self, sketch=False, idleTimeout=None, activeTimeout=None, finishTimeout=None):
+        # flowKey -> Flow
+        self.flows = {}
         self.count = {"TCP": 0, "UDP": 0}
         self.uniqueFlows = {"TCP": [], "UDP": []}
+        # Flows of every host (IP -> list(Flow)) and host pair (hostPair -> list(Flow)),
+        # in the order of uniqueFlows; see getHostFlows and getPairFlows. They are
+        # built by the first query and then kept up to date as flows are added.
+        self.indexed = False
+        self.hostFlows = {"TCP": defaultdict(list), "UDP": defaultdict(list)}
+        self.pairFlows = {"TCP": defaultdict(list), "UDP": defaultdict(list)}
+
+        # ---- Running aggregates, updated as packets arrive
+        self.totalBytes = {"TCP": 0, "UDP": 0}
+        self.totalPackets = {"TCP": 0, "UDP": 0}
+        # Number of valid TCP flows in each state
+        self.states = dict((state, 0) for state in TCP_STATES)
+        self.evicting = idleTimeout is not None or activeTimeout is not None or finishTimeout is not None
+        # Inter-arrival time (ms) of every packet, including flows that later become invalid
+        self.sketch = sketch or self.evicting
+        if (self.sketch):
+            self.interArrivals = {"TCP": LogHistogram(), "UDP": LogHistogram()}
+        else:
+            self.interArrivals = {"TCP": array("d"), "UDP": array("d")}
+        # Flows that became invalid, in that order (dict used as an ordered set)
+        self.invalidFlows = {"TCP": {}, "UDP": {}}
+        # Per-flow metric arrays of valid flows; rebuilt on demand after new packets
+        self._metrics = None
+
+        # ---- Flow eviction
+        self.idleTimeout = idleTimeout
+        self.activeTimeout = activeTimeout
+        self.finishTimeout = finishTimeout
+        # Heap of (deadline, ticket, key, flow); a flow's deadline only moves
+        # later as packets arrive, so entries are checked again when popped
+        self._timeouts = []
+        self._tickets = 0
+        # Metrics of the valid flows that were evicted
+        self.evictedMetrics = {"TCP": dict((m, LogHistogram()) for m in FLOW_METRICS),
+                               "UDP": dict((m, LogHistogram()) for m in FLOW_METRICS)}
+        # Evicted flows still in uniqueFlows
+        self._evicted = set()
 
     def populate(self, packetList):
+        flows = self.flows
+        evicting = self.evicting
+        timeouts = self._timeouts
         for packet in packetList:
-                if (packet.haslayer(TCP) or packet.haslayer(UDP)):
-                    if not(self.addPacket(packet)):
-                        self.updateFlow(packet)
+                packet = decoder.as_record(packet)
+                if (packet.type is None):
+                    continue
+                if (evicting and timeouts and timeouts[0][0] <= packet.time):
+                    self._expire(packet.time)
+                key = flowKey(packet.type, (packet.src, packet.sport), (packet.dst, packet.dport))
+                flow = flows.get(key)
+                if (flow is None):
+                    self._insertFlow(key, Flow(packet))
+                else:
+                    self._addToFlow(flow, packet)
+        self._compact()
+
+    def _insertFlow(self, key, flow):
+        typ = flow.type
+        self.flows[key] = flow
+        self.count[typ] += 1
+        self.uniqueFlows[typ].append(flow)
+        if (self.indexed):
+            self._index(flow)
+
+        self.totalBytes[typ] += flow.totalSize
+        self.totalPackets[typ] += flow.getTotalPackets()
+        self.interArrivals[typ].extend(flow.getInterArrivalTimes())
+        if not (flow.valid):
+            self.invalidFlows[typ][flow] = None
+        elif (typ == "TCP"):
+            self.states[flow.state] += 1
+        if (self.evicting):
+            self._schedule(key, flow)
+        self._metrics = None
+
+    def _addToFlow(self, flow, packet):
+        state = flow.state
+        valid = flow.valid
+        flow.addPacket(packet)
+
+        typ = flow.type
+        self.totalBytes[typ] += packet.size
+        self.totalPackets[typ] += 1
+        self.interArrivals[typ].append((flow.times[-1] - flow.times[-2]) / 1000000)
+        if (valid and not flow.valid):
+            self.invalidFlows[typ][flow] = None
+        if (typ == "TCP" and (state != flow.state or valid != flow.valid)):
+            if (valid):
+                self.states[state] -= 1
+            if (flow.valid):
+                self.states[flow.state] += 1
+            # a completed flow may now time out sooner than scheduled
+            if (self.finishTimeout is not None and flow.state in COMPLETED_STATES):
+                self._schedule(flowKey(typ, flow.nodes[0], flow.nodes[1]), flow)
+        self._metrics = None
+
+    # ==================== Flow Eviction ====================
+
+    def _deadline(self, flow):
+        deadline = float("inf")
+        if (self.idleTimeout is not None):
+            deadline = flow.lastArrival + self.idleTimeout
+        if (self.activeTimeout is not None):
+            deadline = min(deadline, flow.firstArrival + self.activeTimeout)
+        if (self.finishTimeout is not None and flow.type == "TCP" and flow.state in COMPLETED_STATES):
+            deadline = min(deadline, flow.lastArrival + self.finishTimeout)
+        return deadline
+
+    def _schedule(self, key, flow):
+        deadline = self._deadline(flow)
+        if (deadline != float("inf")):
+            self._tickets += 1
+            heapq.heappush(self._timeouts, (deadline, self._tickets, key, flow))
+
+    # Evict every flow that has timed out by time now (in seconds)
+    def expire(self, now):
+        self._expire(now)
+        self._compact()
+
+    def _expire(self, now):
+        timeouts = self._timeouts
+        while (timeouts and timeouts[0][0] <= now):
+            _, _, key, flow = heapq.heappop(timeouts)
+            # skip flows that were already evicted
+            if (self.flows.get(key) is not flow):
+                continue
+            deadline = self._deadline(flow)
+            if (deadline <= now):
+                self._evict(key, flow)
+            else:
+                self._tickets += 1
+                heapq.heappush(timeouts, (deadline, self._tickets, key, flow))
+
+    def _evict(self, key, flow):
+        del self.flows[key]
+        typ = flow.type
+        if (flow.valid):
+            metrics = self.evictedMetrics[typ]
+            metrics["duration"].append(flow.getDuration())
+            metrics["packets"].append(flow.getTotalPackets())
+            metrics["size"].append(flow.totalSize)
+            metrics["overhead"].append(flow.getOverheadRatio())
+        else:
+            # the flow will not become valid again, so drop its inter-arrival times now
+            self.interArrivals[typ].remove(flow.getInterArrivalTimes())
+            del self.invalidFlows[typ][flow]
+
+        # uniqueFlows is rebuilt in bulk once enough of it has been evicted
+        self._evicted.add(flow)
+        if (len(self._evicted) * 2 > len(self.flows)):
+            self._compact()
+        self._metrics = None
+
+    # Drop the flows evicted so far from uniqueFlows and the host indexes.
+    # Evicted flows are dropped in bulk, so call this before reading
+    # uniqueFlows directly; the methods of FlowList do so themselves.
+    def flushEvictions(self):
+        self._compact()
+
+    def _compact(self):
+        if (len(self._evicted) == 0):
+            return
+        evicted = self._evicted
+        for typ in self.uniqueFlows:
+            self.uniqueFlows[typ] = [flow for flow in self.uniqueFlows[typ] if not (flow in evicted)]
+
+        # only the index entries of evicted flows need to be filtered
+        for flow in (evicted if self.indexed else ()):
+            a = flow.nodes[0][0]
+            b = flow.nodes[1][0]
+            for index, key in ((self.hostFlows[flow.type], a), (self.hostFlows[flow.type], b),
+                               (self.pairFlows[flow.type], hostPair(a, b))):
+                flows = index.get(key)
+                if (flows is None):
+                    continue
+                flows = [f for f in flows if not (f in evicted)]
+                if (len(flows) > 0):
+                    index[key] = flows
+                else:
+                    del index[key]
+        self._evicted = set()
+
+    # ==================== Host Indexes ====================
+
+    def _index(self, flow):
+        a = flow.nodes[0][0]
+        b = flow.nodes[1][0]
+        hosts = self.hostFlows[flow.type]
+        hosts[a].append(flow)
+        if (a != b):
+            hosts[b].append(flow)
+        self.pairFlows[flow.type][hostPair(a, b)].append(flow)
+
+    def _reindex(self):
+        for typ in self.uniqueFlows:
+            self.hostFlows[typ] = defaultdict(list)
+            self.pairFlows[typ] = defaultdict(list)
+            for flow in self.uniqueFlows[typ]:
+                self._index(flow)
+        self.indexed = True
+
+    def _ensureIndexed(self):
+        self._compact()
+        if not (self.indexed):
+            self._reindex()
+
+    # Flows of type typ with host as an endpoint, in order of arrival.
+    # The list is the index itself and must not be modified.
+    def getHostFlows(self, typ, host):
+        self._ensureIndexed()
+        return self.hostFlows[typ].get(host, [])
+
+    # Flows of type typ between hosts a and b in either direction, in order of arrival.
+    # The list is the index itself and must not be modified.
+    def getPairFlows(self, typ, a, b):
+        self._ensureIndexed()
+        return self.pairFlows[typ].get(hostPair(a, b), [])
 
     # Return True if flow added; False if not added -- flow already exists
     def addFlow(self, flow):
-        curFlows = self.flows[flow.type]
-        for i in range(2):
-            node = flow.nodes[i]
-            
-            # If we do not have a flow with this (IP, port), we can add it.
-            if not (node in curFlows):
-                break
-            elif (i == 1):
-                return False
-
-            # Move into the dictionary by one more depth.
-            curFlows = curFlows[node]
-            
-        curFlows = self.flows[flow.type]
-        self.count[flow.type] += 1
-        self.uniqueFlows[flow.type].append(flow)
-
-        if not (flow.nodes[0] in curFlows):
-            curFlows[flow.nodes[0]] = {flow.nodes[1] : flow}
-        else:
-            curFlows[flow.nodes[0]][flow.nodes[1]] = flow
-        
-        if not (flow.nodes[1] in curFlows):
-            curFlows[flow.nodes[1]] = {flow.nodes[0] : flow}
-        else:
-            curFlows[flow.nodes[1]][flow.nodes[0]] = flow
+        key = flowKey(flow.type, flow.nodes[0], flow.nodes[1])
+        if (key in self.flows):
+            return False
 
+        self._insertFlow(key, flow)
         return True
     
     # Parse the packet into a Flow before adding
     # Return True if flow added; False if not added -- flow already exists or packet invalid
     def addPacket(self, p):
-        try:
-            flow = Flow(p)
-        except ValueError:
+        p = decoder.as_record(p)
+        if (p.type is None):
             return False
+        if (self.evicting):
+            self._expire(p.time)
 
-        return self.addFlow(flow)
+        key = flowKey(p.type, (p.src, p.sport), (p.dst, p.dport))
+        if (key in self.flows):
+            return False
+
+        self._insertFlow(key, Flow(p))
+        return True
 
     # Update the flow info
     # Return True if flow updated; False if not updated -- flow doesn't exist or packet invalid
     def updateFlow(self, p):
-        ip = ""
-        try:
-            ip = p[IP]
-        except IndexError:
-            ip = p[IPv6]
-        except:
+        p = decoder.as_record(p)
+        if (p.type is None):
             return False
+        if (self.evicting):
+            self._expire(p.time)
 
-        transport = ""
-        typ = ""
-
-        try:
-            transport = p[TCP]
-            typ = "TCP"
-        except IndexError:
-            transport = p[UDP]
-            typ = "UDP"
-        except:
+        flow = self.flows.get(flowKey(p.type, (p.src, p.sport), (p.dst, p.dport)))
+        if (flow is None):
             return False
 
-        curFlows = self.flows[typ]
-        src = (ip.src, transport.sport)
-        dst = (ip.dst, transport.dport)
+        self._addToFlow(flow, p)
+        return True
 
-        try:
-            flow = curFlows[src][dst]
-            flow.addPacket(p)
-            return True
-        except:
-            return False
+    # Add the flows of other FlowLists that hold disjoint sets of flows
+    # (e.g. shards of one trace). Flows are ordered by their first packet,
+    # the same order a single populate over the whole trace produces.
+    def merge(self, flowLists):
+        for other in flowLists:
+            self.flows.update(other.flows)
+            for typ in self.count:
+                self.count[typ] += other.count[typ]
+                self.uniqueFlows[typ].extend(other.uniqueFlows[typ])
+                self.totalBytes[typ] += other.totalBytes[typ]
+                self.totalPackets[typ] += other.totalPackets[typ]
+                self.interArrivals[typ].extend(other.interArrivals[typ])
+                self.invalidFlows[typ].update(other.invalidFlows[typ])
+                for metric in FLOW_METRICS:
+                    self.evictedMetrics[typ][metric].extend(other.evictedMetrics[typ][metric])
+            for state in self.states:
+                self.states[state] += other.states[state]
+            if (self.evicting):
+                for key, flow in other.flows.items():
+                    self._schedule(key, flow)
+        if (self.evicting and self.flows):
+            # each shard only expired flows as of its own packets; catch up
+            # with the latest packet of all of them, as one populate would have
+            self.expire(max(flow.lastArrival for flow in self.flows.values()))
+
+        for typ in self.uniqueFlows:
+            self.uniqueFlows[typ].sort(key=lambda flow: flow.firstIndex)
+        if (self.indexed):
+            self._reindex()
+        self._metrics = None
 
     def getTotalBytes(self, typ):
-        total = 0
-        for flow in self.uniqueFlows[typ]:
-            total += flow.getTotalSize()
-
-        return total
+        return self.totalBytes[typ]
+
+    # Return a numpy array holding the given metric for every valid flow of type typ.
+    # metric is one of "duration", "packets", "size", "overhead" or "interarrival";
+    # "interarrival" holds one value per packet instead of one per flow,
+    # and is a LogHistogram in sketch mode. Evicted flows are included, which
+    # makes every metric a LogHistogram when flows can be evicted.
+    def getFlowMetric(self, typ, metric):
+        if (metric == "interarrival"):
+            return self._getInterArrivalTimes(typ)
+
+        self._compact()
+        if (self._metrics is None):
+            self._metrics = {}
+        if not (typ in self._metrics):
+            # one pass over the flows fills in every per-flow metric
+            duration = []
+            packets = []
+            size = []
+            overhead = []
+            for flow in self.uniqueFlows[typ]:
+                if (flow.valid):
+                    duration.append(flow.getDuration())
+                    packets.append(flow.getTotalPackets())
+                    size.append(flow.totalSize)
+                    overhead.append(flow.getOverheadRatio())
+            if (self.evicting):
+                evicted = self.evictedMetrics[typ]
+                self._metrics[typ] = {"duration": _withValues(evicted["duration"], duration),
+                                      "packets": _withValues(evicted["packets"], packets),
+                                      "size": _withValues(evicted["size"], size),
+                                      "overhead": _withValues(evicted["overhead"], overhead)}
+            else:
+                self._metrics[typ] = {"duration": np.array(duration),
+                                      "packets": np.array(packets, dtype=np.int64),
+                                      "size": np.array(size, dtype=np.int64),
+                                      "overhead": np.array(overhead)}
+        return self._metrics[typ][metric]
+
+    # The k flows of type typ with the largest metric; see topFlows.
+    # Evicted flows are not included.
+    def getTopFlows(self, typ, metric, k):
+        self._compact()
+        return topFlows(self.uniqueFlows[typ], metric, k)
+
+    # The k host pairs with the most flows of type typ; see topHostPairs.
+    # Once the host indexes are built this ranks the pairs without a pass over the flows.
+    def getTopHostPairs(self, typ, k):
+        self._compact()
+        if (self.indexed):
+            return _topPairs(self.pairFlows[typ], k)
+        return topHostPairs(self.uniqueFlows[typ], k)
+
+    # The k hosts with the most flows of type typ, as a list of
+    # (count, IP, list(Flow)), largest first
+    def getTopHosts(self, typ, k):
+        self._ensureIndexed()
+        top = heapq.nlargest(k, self.hostFlows[typ].items(), key=lambda item: len(item[1]))
+        return [(len(flows), host, flows) for host, flows in top]
+
+    def _getInterArrivalTimes(self, typ):
+        if (self.sketch):
+            # the values of invalid flows fall in the same buckets they were added to
+            sketch = self.interArrivals[typ].copy()
+            for flow in self.invalidFlows[typ]:
+                sketch.remove(flow.getInterArrivalTimes())
+            return sketch
+
+        values = np.array(self.interArrivals[typ], dtype=np.float64)
+        if (len(self.invalidFlows[typ]) == 0):
+            return values
+
+        # drop the values of invalid flows: they are recomputed exactly from the
+        # flows' timestamps and removed from the buffer as a multiset
+        invalid = np.concatenate([flow.getInterArrivalTimes() for flow in self.invalidFlows[typ]])
+        allValues, allCounts = np.unique(values, return_counts=True)
+        invalidValues, invalidCounts = np.unique(invalid, return_counts=True)
+        allCounts[np.searchsorted(allValues, invalidValues)] -= invalidCounts
+        return np.repeat(allValues, allCounts)
 
     def print(self):
-        i = 0
-        j = 0
-        for key, val in self.flows["TCP"].items():
-            for key2, val2 in val.items():
-                print(key, " : ", key2)
-                i += 1
-        for key, val in self.flows["UDP"].items():
-            for key2, val2 in val.items():
-                print(key, " : ", key2)
-                j += 1
+        for key in self.flows:
+            print(key[1], " : ", key[2])
 
+        i = self.count["TCP"]
+        j = self.count["UDP"]
         print("\n== TCP: " + str(i) + " ==")
         print("== UDP: " + str(j) + " ==")
-        print("== Total: " + str(i + j) + " ==")
\ No newline at end of file
+        print("== Total: " + str(i + j) + " ==")
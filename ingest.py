@@ -0,0 +1,314 @@
+import collections
+import glob
+import gzip
+import heapq
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import decoder
+
+# ======================== Pipelined Ingestion ========================
+# Reads a trace in three stages that run at the same time, connected by
+# bounded queues:
+#
+#   reader thread   large sequential reads of the file into chunk buffers
+#   decode thread   the complete pcap records of each chunk -> PacketRecords
+#   caller          gets one list of records per chunk from read_batches()
+#
+# The reader waits on the disk in read(), which releases the GIL, so stalls
+# of network storage or a cold page cache are hidden behind decoding and
+# the flow bookkeeping of the caller. A stage blocks once the queue it feeds
+# is full, which bounds memory to about QUEUE_DEPTH chunks per queue however
+# slow the caller is. Decoding and aggregation are Python code and still
+# take turns on the GIL.
+#
+# Captures that are not classic pcap (e.g. pcapng) are read and decoded by
+# scapy in a single thread ahead of the caller.
+#
+# A trace can also be split into segments: a directory or glob of capture
+# files, each of them classic pcap or pcapng and optionally compressed with
+# gzip or zstd (the zstandard package). Segments are decompressed and decoded
+# in threads of their own (zlib and zstd release the GIL) and merged in
+# timestamp order; see read_records.
+
+# Bytes read from the trace at a time
+CHUNK_SIZE = 4 << 20
+# Chunks or batches waiting in each queue
+QUEUE_DEPTH = 4
+# Records per batch of captures read through scapy
+BATCH_SIZE = 4096
+# Seconds between checks whether the consumer went away
+_POLL = 0.1
+# Bytes decompressed to find the first timestamp of a segment
+_PEEK_SIZE = 1 << 16
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+_END = object()
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+# Yield the items of q up to _END, raising the error of a failed producer
+def _drain(q, stop):
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=_POLL)
+        except queue.Empty:
+            continue
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+# Thread body: put the items of iterable on q, then _END
+def _produce(iterable, q, stop):
+    try:
+        for item in iterable:
+            if not _put(q, item, stop):
+                return
+        _put(q, _END, stop)
+    except BaseException as error:
+        _put(q, _Failure(error), stop)
+
+def _read_chunks(f, chunk_size):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+# Decode the pcap records of a stream of chunks; a record split across two
+# chunks is decoded with the second one. With decode=decoder._read_pcap_frames
+# the records are only split into Frames.
+def _decode_chunks(chunks, decode=decoder._decode_pcap_records):
+    pending = b''
+    header = None
+    index = 0
+    for chunk in chunks:
+        data = pending + chunk if pending else chunk
+        off = 0
+        if header is None:
+            if len(data) < decoder._PCAP_HEADER_LEN:
+                pending = data
+                continue
+            header = decoder._read_pcap_header(data)
+            off = decoder._PCAP_HEADER_LEN
+        records, off, index = decode(memoryview(data), off, header, index)
+        pending = data[off:]
+        if len(records) > 0:
+            yield records
+
+def _batched(records, size):
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+# Yield the PacketRecords of the trace at path in lists, decoded ahead of
+# the caller; the same records as decoder.read_records(path), in order.
+def read_batches(path, chunk_size=CHUNK_SIZE, depth=QUEUE_DEPTH):
+    stop = threading.Event()
+    batches = queue.Queue(depth)
+    threads = []
+    f = open(path, 'rb')
+    try:
+        if f.read(4) in decoder._PCAP_MAGIC:
+            f.seek(0)
+            if hasattr(os, 'posix_fadvise'):
+                # ask for aggressive read-ahead
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            chunks = queue.Queue(depth)
+            threads.append(threading.Thread(target=_produce, args=(_read_chunks(f, chunk_size), chunks, stop),
+                                            name='ingest reader', daemon=True))
+            threads.append(threading.Thread(target=_produce, args=(_decode_chunks(_drain(chunks, stop)), batches, stop),
+                                            name='ingest decoder', daemon=True))
+        else:
+            threads.append(threading.Thread(target=_produce, args=(_batched(decoder.read_records(path), BATCH_SIZE), batches, stop),
+                                            name='ingest decoder', daemon=True))
+        for thread in threads:
+            thread.start()
+        for batch in _drain(batches, stop):
+            yield batch
+    finally:
+        # also stops the threads when the caller gives up early
+        stop.set()
+        for thread in threads:
+            thread.join()
+        f.close()
+
+# ======================== Segmented Traces ========================
+
+# The capture files of the trace at path: the files of a directory or the
+# matches of a glob, sorted by name, or just path itself
+def trace_segments(path):
+    if os.path.isdir(path):
+        segments = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                    if not name.startswith('.') and os.path.isfile(os.path.join(path, name))]
+    elif glob.has_magic(path):
+        segments = sorted(p for p in glob.glob(path) if os.path.isfile(p))
+    else:
+        return [path]
+    if len(segments) == 0:
+        raise FileNotFoundError("No capture files in '" + path + "'")
+    return segments
+
+# Whether the trace at path is a single uncompressed capture file, which
+# decoder.read_records reads directly
+def is_plain_trace(path):
+    if os.path.isdir(path) or glob.has_magic(path):
+        return False
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return not (magic.startswith(_GZIP_MAGIC) or magic == _ZSTD_MAGIC)
+
+# Open a capture file for reading, decompressing it on the fly
+def _open_segment(path):
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.open(path, 'rb')
+    if magic == _ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading '" + path + "' needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+    return open(path, 'rb')
+
+# Yield the PacketRecords of one segment in lists; the index of each record
+# counts the packets of the segment only
+def _segment_batches(path, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    with _open_segment(path) as f:
+        head = f.read(chunk_size)
+        if head[:4] in decoder._PCAP_MAGIC:
+            yield from _decode_chunks(itertools.chain((head,), _read_chunks(f, chunk_size)))
+            return
+    # pcapng, read by scapy from the start
+    with _open_segment(path) as f:
+        yield from _batched(decoder._iter_scapy(f), batch_size)
+
+# The same as _segment_batches, but yields undecoded decoder.Frames
+def _segment_frames(path, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE):
+    with _open_segment(path) as f:
+        head = f.read(chunk_size)
+        if head[:4] in decoder._PCAP_MAGIC:
+            yield from _decode_chunks(itertools.chain((head,), _read_chunks(f, chunk_size)),
+                                      decoder._read_pcap_frames)
+            return
+    with _open_segment(path) as f:
+        yield from _batched(decoder._iter_raw_scapy(f), batch_size)
+
+def _first_time(path):
+    for batch in _segment_batches(path, _PEEK_SIZE, 1):
+        return batch[0].time_ns
+    return None
+
+# Merge the records of segments, a list of (first time, path) sorted by first
+# time, into timestamp order. At least the next workers segments are decoded
+# ahead in threads, and every segment is merged from the time of its first
+# packet on, so only segments that overlap in time are in the heap at once.
+# batches(path, chunk_size) yields the items of a segment in lists.
+def _merge(segments, workers, chunk_size, depth, batches=_segment_batches):
+    stop = threading.Event()
+    threads = []
+    waiting = collections.deque(enumerate(segments))
+    started = collections.deque()
+    heap = []
+
+    def start():
+        order, (first, path) = waiting.popleft()
+        q = queue.Queue(depth)
+        thread = threading.Thread(target=_produce, args=(batches(path, chunk_size), q, stop),
+                                  name='ingest ' + os.path.basename(path), daemon=True)
+        thread.start()
+        threads.append(thread)
+        started.append((first, order, itertools.chain.from_iterable(_drain(q, stop))))
+
+    try:
+        while True:
+            while waiting and len(heap) + len(started) < workers:
+                start()
+            # merge the segments that start before the next packet
+            while started or waiting:
+                first = started[0][0] if started else waiting[0][1][0]
+                if heap and first > heap[0][0]:
+                    break
+                if not started:
+                    start()
+                first, order, records = started.popleft()
+                record = next(records, None)
+                if record is not None:
+                    heapq.heappush(heap, (record.time_ns, order, record, records))
+            if len(heap) == 0:
+                return
+
+            time, order, record, records = heap[0]
+            yield record
+            if len(heap) == 1:
+                # a single segment needs no heap until the next one starts
+                limit = started[0][0] if started else waiting[0][1][0] if waiting else float('inf')
+                for record in records:
+                    if record.time_ns >= limit:
+                        heap[0] = (record.time_ns, order, record, records)
+                        break
+                    yield record
+                else:
+                    heap.pop()
+                continue
+            record = next(records, None)
+            if record is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (record.time_ns, order, record, records))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+def _read_segments(path, chunk_size, depth, workers, batches=_segment_batches):
+    paths = trace_segments(path)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max(1, min(workers, len(paths)))) as pool:
+        firsts = list(pool.map(_first_time, paths))
+    segments = sorted((first, p) for first, p in zip(firsts, paths) if first is not None)
+    index = 0
+    for record in _merge(segments, max(1, workers), chunk_size, depth, batches):
+        record.index = index
+        index += 1
+        yield record
+
+# Yield the PacketRecords of the trace at path, read and decoded ahead of the
+# caller. path is a capture file, or a directory or glob of segments merged
+# in timestamp order (decoded by up to workers threads at a time, all CPUs
+# by default); records are numbered in merged order.
+def read_records(path, chunk_size=CHUNK_SIZE, depth=QUEUE_DEPTH, workers=None):
+    if not is_plain_trace(path):
+        yield from _read_segments(path, chunk_size, depth, workers)
+        return
+    for batch in read_batches(path, chunk_size, depth):
+        yield from batch
+
+# Yield the packets of the trace at path as undecoded decoder.Frames, in the
+# order and with the numbering read_records gives their PacketRecords; for
+# splitting a trace without decoding it (see shard.py)
+def read_frames(path, chunk_size=CHUNK_SIZE, depth=QUEUE_DEPTH, workers=None):
+    yield from _read_segments(path, chunk_size, depth, workers, _segment_frames)
@@ -0,0 +1,186 @@
+import atexit
+import cProfile
+import collections
+import itertools
+import os
+import resource
+import signal
+import sys
+import time
+
+# ======================== Instrumentation ========================
+# Per-stage wall/CPU time, packet and flow counts and peak memory of the
+# analysis scripts, printed when the script exits. It is off by default and
+# then costs one function call per stage; enable it with
+#
+#   --profile              or  TRACE_PROFILE=1
+#   --profile-out FILE     or  TRACE_PROFILE_OUT=FILE   (cProfile stats, see pstats)
+#   --sample-out FILE      or  TRACE_SAMPLE_OUT=FILE    (sampled stacks)
+#
+# on any *_main script; setup(argv) reads them. Stages nest: the time a stage
+# spends in the stages it encloses is reported in their rows, not its own.
+# The sampled stacks are written one per line in the folded format read by
+# flamegraph.pl and speedscope.
+
+# Records pulled from the trace at a time by timed_iter
+BATCH_SIZE = 4096
+# Interval of the stack sampler (seconds of CPU time)
+SAMPLE_INTERVAL = 0.005
+
+enabled = False
+_stages = collections.OrderedDict()
+_stack = []
+_counters = collections.OrderedDict()
+_profiler = None
+_samples = None
+
+class _Stage:
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+        self.items = 0
+        self.peak_rss_kb = 0
+
+    def __enter__(self):
+        _stack.append(self)
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._start[0]
+        cpu = time.process_time() - self._start[1]
+        _stack.pop()
+        self.calls += 1
+        self.wall += wall
+        self.cpu += cpu
+        self.peak_rss_kb = _peak_rss_kb()
+        if len(_stack) > 0:
+            _stack[-1].child_wall += wall
+            _stack[-1].child_cpu += cpu
+        return False
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+def _peak_rss_kb():
+    # worker processes (sharding) count once they have been waited for
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+# Context manager timing the code it encloses as the stage name; entering the
+# same stage again adds to its totals
+def stage(name):
+    if not enabled:
+        return _NULL_STAGE
+    key = tuple(s.name for s in _stack) + (name,)
+    current = _stages.get(key)
+    if current is None:
+        current = _Stage(name, len(_stack))
+        _stages[key] = current
+    return current
+
+# Iterate over iterable, timing the production of its items as the stage name.
+# Items are pulled BATCH_SIZE at a time so the timer is not read per item.
+def timed_iter(name, iterable):
+    if not enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with stage(name) as current:
+            batch = list(itertools.islice(iterator, BATCH_SIZE))
+        current.items += len(batch)
+        if len(batch) == 0:
+            return
+        yield from batch
+
+def count(name, n=1):
+    if enabled:
+        _counters[name] = _counters.get(name, 0) + n
+
+# Count the packets and flows of a populated flow.FlowList
+def count_flows(flowLst):
+    if not enabled:
+        return
+    created = sum(flowLst.count.values())
+    count("packets in flows", sum(flowLst.totalPackets.values()))
+    count("flows created", created)
+    count("flows evicted", created - len(flowLst.flows))
+
+# ======================== Setup and Report ========================
+
+def _option(argv, flag, variable):
+    if flag in argv:
+        return argv[argv.index(flag) + 1]
+    return os.environ.get(variable) or None
+
+def setup(argv):
+    global enabled, _profiler
+    profile_out = _option(argv, "--profile-out", "TRACE_PROFILE_OUT")
+    sample_out = _option(argv, "--sample-out", "TRACE_SAMPLE_OUT")
+    enabled = ("--profile" in argv or os.environ.get("TRACE_PROFILE", "") not in ("", "0")
+               or profile_out is not None or sample_out is not None)
+    if not enabled:
+        return
+    if profile_out is not None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if sample_out is not None:
+        _start_sampler()
+    start = (time.perf_counter(), time.process_time())
+    atexit.register(_finish, start, profile_out, sample_out)
+
+def _start_sampler():
+    global _samples
+    _samples = collections.Counter()
+
+    def sample(signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(code.co_name + " (" + os.path.basename(code.co_filename) + ":" + str(code.co_firstlineno) + ")")
+            frame = frame.f_back
+        _samples[";".join(reversed(names))] += 1
+
+    signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, SAMPLE_INTERVAL, SAMPLE_INTERVAL)
+
+def _finish(start, profile_out, sample_out):
+    wall = time.perf_counter() - start[0]
+    cpu = time.process_time() - start[1]
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(profile_out)
+        print("> Saved profile to '" + profile_out + "'", file=sys.stderr)
+    if _samples is not None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        with open(sample_out, "w") as f:
+            for stack, n in _samples.most_common():
+                f.write(stack + " " + str(n) + "\n")
+        print("> Saved " + str(sum(_samples.values())) + " stack samples to '" + sample_out + "'", file=sys.stderr)
+    report(wall, cpu)
+
+def report(wall=None, cpu=None, file=sys.stderr):
+    file.write("%-28s %6s %10s %10s %10s %12s %12s\n" % ("stage", "calls", "wall (s)", "self (s)", "cpu (s)", "items/s", "peak RSS kB"))
+    for current in _stages.values():
+        rate = "" if current.items == 0 or current.wall <= 0 else "%.0f" % (current.items / current.wall)
+        file.write("%-28s %6d %10.3f %10.3f %10.3f %12s %12d\n" % (
+            "  " * current.depth + current.name, current.calls, current.wall,
+            current.wall - current.child_wall, current.cpu, rate, current.peak_rss_kb))
+    if wall is not None:
+        file.write("%-28s %6s %10.3f %10s %10.3f %12s %12d\n" % ("total", "", wall, "", cpu, "", _peak_rss_kb()))
+    for name, n in _counters.items():
+        file.write("%-28s %d\n" % (name, n))
@@ -1,3 +1,10 @@
+import numpy as np
+
+from sketch import IntHistogram, LogHistogram
+
+# Packets between folding the buffered sizes into the histograms
+FLUSH_INTERVAL = 1 << 16
+
 class Layer:
     """
     Instance variables
@@ -11,19 +18,24 @@ class Layer:
         tracks occurrence for each packet type
     self.packet_types: set(str)
         main packet types in this layer
-    self.packet_sizes_list: dict(str:[])
-        for every layer type, record list of packet sizes
-    self.header_sizes_list: dict(str:[])
-        for every layer type, record list packet header sizes
+    self.packet_types_bytes: dict(str:int)
+        total size in bytes of the packets of each type
+    self.packet_sizes_list: dict(str:IntHistogram)
+        for every layer type, record histogram of packet sizes
+        (a LogHistogram sketch when sketch is set)
+    self.header_sizes_list: dict(str:IntHistogram)
+        for every layer type, record histogram of packet header sizes
+        (a LogHistogram sketch when sketch is set)
     self.other_packets: set(str)
         array of packet types other than main ones (ones in packet_types)
     """
-    def __init__(self, layer_name, packet_types):
+    def __init__(self, layer_name, packet_types, sketch=False):
         # define instance variables
         self.layer_name = layer_name
         self.total_packets = 0
         self.total_bytes = 0
         self.packet_types_counter = {}
+        self.packet_types_bytes = {}
         self.packet_types = packet_types
         self.packet_sizes_list = {}
         self.header_sizes_list = {}
@@ -32,8 +44,13 @@ class Layer:
         self.packet_types.add('Other')
         for t in self.packet_types:
             self.packet_types_counter[t] = 0
-            self.packet_sizes_list[t] = []
-            self.header_sizes_list[t] = []
+            self.packet_types_bytes[t] = 0
+            if sketch:
+                self.packet_sizes_list[t] = LogHistogram()
+                self.header_sizes_list[t] = LogHistogram()
+            else:
+                self.packet_sizes_list[t] = IntHistogram()
+                self.header_sizes_list[t] = IntHistogram()
     
     def add_packet_occurrence(self, packet_type, packet_size, header_size):
         """
@@ -44,13 +61,42 @@ class Layer:
         self.total_bytes += packet_size
         if packet_type in self.packet_types:
             self.packet_types_counter[packet_type] += 1
+            self.packet_types_bytes[packet_type] += packet_size
             self.packet_sizes_list[packet_type].append(packet_size)
             self.header_sizes_list[packet_type].append(header_size)
         else:
             self.packet_types_counter['Other'] += 1
+            self.packet_types_bytes['Other'] += packet_size
             self.packet_sizes_list['Other'].append(packet_size)
             self.header_sizes_list['Other'].append(header_size)
             self.other_packets.add(packet_type)
+        if self.total_packets % FLUSH_INTERVAL == 0:
+            self.flush()
+
+    def add_packets(self, packet_type, packet_sizes, header_size):
+        """
+        Add packets of one type that all have the same header size
+        Parameters
+        packet_type: str
+        packet_sizes: numpy array(int)
+        header_size: int
+        """
+        count = len(packet_sizes)
+        size_sum = int(packet_sizes.sum())
+        self.total_packets += count
+        self.total_bytes += size_sum
+        if not (packet_type in self.packet_types):
+            self.other_packets.add(packet_type)
+            packet_type = 'Other'
+        self.packet_types_counter[packet_type] += count
+        self.packet_types_bytes[packet_type] += size_sum
+        self.packet_sizes_list[packet_type].extend(packet_sizes)
+        self.header_sizes_list[packet_type].extend(np.full(count, header_size, dtype=np.int64))
+
+    def flush(self):
+        for t in self.packet_types:
+            self.packet_sizes_list[t].flush()
+            self.header_sizes_list[t].flush()
 
     def generate_table(self):
         table = []
@@ -60,7 +106,7 @@ class Layer:
         for packet_type in self.packet_types:
             count = self.packet_types_counter[packet_type]
             percentage = float(count) / self.total_packets * 100
-            type_sum = sum(self.packet_sizes_list[packet_type])
+            type_sum = self.packet_types_bytes[packet_type]
             row = [packet_type, count, percentage, type_sum]
             # hold the 'other' row to be appended last
             if (packet_type == 'Other'):
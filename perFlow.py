@@ -1,17 +1,92 @@
 import trace_parser as parser
 import numpy as np
-import matplotlib
-from matplotlib import pyplot as plt
 from scapy.all import *
 
 from flow import *
-import sys, os
+import rtt
+import shard
+import sketch
+import cache
+import instrument
+import render
+import sys, os, time
 
 # This 'constant' is used as a filter flag when plotting;
 #   also used as the label name on the plot
 PLOT_ALL = "All Flows"
 
-global fig, ax
+# The render.Figure being built by the plot functions below
+global fig
+
+# ============================ Flow List ============================
+def getWorkerCount(argv):
+    if ("-j" in argv):
+        return int(argv[argv.index("-j") + 1])
+    return 1
+
+# --idle S, --active S, --finish S: evict flows after these timeouts (seconds);
+# see FlowList
+def getTimeouts(argv):
+    timeouts = {}
+    for flag, name in (("--idle", "idleTimeout"), ("--active", "activeTimeout"), ("--finish", "finishTimeout")):
+        if (flag in argv):
+            timeouts[name] = float(argv[argv.index(flag) + 1])
+    return timeouts
+
+# With useCache, the plain FlowList (no sketch, no timeouts) is loaded from
+# and saved to the trace cache; see cache.py. With pipelined, the trace is
+# read and decoded in threads while the flows are updated; see ingest.py
+def populateFlowList(path, workers=1, useSketch=False, timeouts=None, useCache=True, pipelined=False):
+    if (timeouts is None):
+        timeouts = {}
+    useCache = useCache and not useSketch and len(timeouts) == 0
+    if (useCache):
+        with instrument.stage("cache load"):
+            flowLst = cache.load_flows(path)
+        if (flowLst is not None):
+            print("> Loaded flow list of '" + path + "' from cache")
+            instrument.count_flows(flowLst)
+            return flowLst
+
+    with instrument.stage("populate"):
+        if (workers > 1):
+            flowLst = shard.populateSharded(path, workers, useSketch, timeouts)
+        else:
+            flowLst = FlowList(useSketch, **timeouts)
+            flowLst.populate(instrument.timed_iter("parse", parser._parse_tracefile(path, decode=True, pipelined=pipelined)))
+
+    if (useCache):
+        with instrument.stage("cache save"):
+            cache.save_flows(path, flowLst)
+    instrument.count_flows(flowLst)
+    return flowLst
+
+# Feed the packets of a capture that is still being written into a FlowList
+# and rewrite the fName markdown report at most every interval seconds while
+# new packets keep arriving. Returns the FlowList once the capture ends
+# (see decoder.follow_batches) or on Ctrl-C.
+def followFlowList(source, fName, interval=1.0, useSketch=False, timeouts=None, idleTimeout=None):
+    if (timeouts is None):
+        timeouts = {}
+    flowLst = FlowList(useSketch, **timeouts)
+    lastWrite = 0
+    changed = False
+    try:
+        for batch in parser.follow_tracefile(source, min(interval, 0.1), idleTimeout):
+            if (len(batch) > 0):
+                with instrument.stage("populate"):
+                    flowLst.populate(batch)
+                changed = True
+            if (changed and time.monotonic() - lastWrite >= interval):
+                with instrument.stage("markdown"):
+                    writeMarkdown(fName, flowLst)
+                lastWrite = time.monotonic()
+                changed = False
+    except KeyboardInterrupt:
+        pass
+    writeMarkdown(fName, flowLst)
+    instrument.count_flows(flowLst)
+    return flowLst
 
 # ============================ Report/CDF Functions ============================
 def writeReportHeader(file):
@@ -20,6 +95,16 @@ def writeReportHeader(file):
     file.write("## Analysis\n")
     file.write("### Per-Flow Statistics\n")
 
+# Write the report tables to fName.md; the file is replaced in one step so
+# a reader never sees a partly written report
+def writeMarkdown(fName, flowLst):
+    f = open(fName + ".md.tmp", "w")
+    writeReportHeader(f)
+    writeFlowCountTable(f, flowLst)
+    writeStatesTable(f, flowLst)
+    f.close()
+    os.replace(fName + ".md.tmp", fName + ".md")
+
 def writeFlowCountTable(f, flowLst):
     f.write("#### Flow Type Count\n")
     f.write("||Count|Percentage|Bytes|\n")
@@ -36,10 +121,7 @@ def writeFlowCountTable(f, flowLst):
     f.write("|UDP|" + str(udpCount) + "|" + "{:.1%}".format(percent) + "|" + str(udpBytes) + "|\n")
 
 def writeStatesTable(f, flowLst):
-    states = {"Request": 0,"Reset": 0,"Finished": 0,"Ongoing": 0,"Failed": 0}
-    for flow in flowLst.uniqueFlows["TCP"]:
-        if (flow.isValid()):
-            states[flow.getState()] += 1
+    states = flowLst.states
 
     f.write("#### TCP Flow States\n")
 
@@ -54,229 +136,72 @@ def writeStatesTable(f, flowLst):
     f.write(row2 + "\n")
 
 def initCDF(title, xlabel, ylabel):
-    global fig, ax
-    fig, ax = plt.subplots()
-    plt.title(title)
-    plt.subplots_adjust(bottom=0.15)
-    plt.xlabel(xlabel, labelpad=10)
-    plt.ylabel(ylabel, labelpad=10)
-    plt.grid(linestyle="dashed", alpha=0.75)
+    global fig
+    fig = render.Figure(title, xlabel, ylabel, grid=True, labelpad=10, bottom=0.15)
 
+# data is either a sequence of values or a sketch.LogHistogram
 def plotCDF(data, label):
-    x = np.sort(data)
-    y = np.arange(1, len(x)+1) / len(x)
-    ax.plot(x, y, label=label)
+    x, y = sketch.cdf_points(data)
+    fig.plot(x, y, label)
 
+# Save the CDF with a linear and a log x axis; see render.submit
 def displayCDF(name):
-    ax.legend()
-    try:
-        fig.savefig("plots/" + name + ".png", dpi=300)
-    except:
-        os.makedirs("plots")
-
-    ax.set_xscale('log')
-    try:
-        fig.savefig("plots/" + name + "-log.png", dpi=300)
-    except:
-        os.makedirs("plots")
+    fig.legend = True
+    fig.save("plots/" + name + ".png")
+    fig.save("plots/" + name + "-log.png", xscale='log')
+    render.submit(fig)
 
-def plotFlow(flowLst, flowFunction, filterType=["TCP", "UDP", PLOT_ALL]):
+# Plot a metric FlowList keeps for every flow; see FlowList.getFlowMetric
+def plotFlowMetric(flowLst, metric, filterType=["TCP", "UDP", PLOT_ALL]):
     data = []
-    for typ, lst in flowLst.uniqueFlows.items():
+    for typ in flowLst.uniqueFlows:
         if not (typ in filterType):
             continue
-        localData = []
-        for flow in lst:
-            if (flow.isValid()):
-                t = flowFunction(flow)
-                try:
-                    localData.extend(t)
-                    if (PLOT_ALL in filterType):
-                        data.extend(t)
-                except:
-                    localData.append(t)
-                    if (PLOT_ALL in filterType):
-                        data.append(t)
-
+        localData = flowLst.getFlowMetric(typ, metric)
         plotCDF(localData, typ)
+        data.append(localData)
 
     if (PLOT_ALL in filterType):
-        plotCDF(data, PLOT_ALL)
+        plotCDF(sketch.combine(data), PLOT_ALL)
 
 # ====================== Get Top 3 Flows ======================
-def getMostPacketsFlows(flowArray, excludeIndex):
-    mostPacketFlow = None
-    mostPacketCount = -1
-    mostPacketIndex = -1
-    for i in range(len(flowArray)):
-        if i in excludeIndex:
-            continue
-        flow = flowArray[i]
-        pktCount = len(flow.packets)
-        # initialize most packets attributes
-        # or update flow with most packets
-        if mostPacketCount == -1 or pktCount > mostPacketCount:
-            mostPacketFlow = flow
-            mostPacketCount = pktCount
-            mostPacketIndex = i
-    return mostPacketFlow, mostPacketCount, mostPacketIndex
-
-def getMostBytesFlows(flowArray, excludeIndex):
-    mostBytesFlow = None
-    mostBytesCount = -1
-    mostBytesIndex = -1
-    for i in range(len(flowArray)):
-        if i in excludeIndex:
-            continue
-        flow = flowArray[i]
-        bytesCount = flow.totalSize
-        # initialize most bytes attributes
-        # or update flow with most bytes
-        if mostBytesCount == -1 or bytesCount > mostBytesCount:
-            mostBytesFlow = flow
-            mostBytesCount = bytesCount
-            mostBytesIndex = i
-    return mostBytesFlow, mostBytesCount, mostBytesIndex
-
-def getLongestDurationFlows(flowArray, excludeIndex):
-    longestFlow = None
-    longestDuration = -1
-    longestDurationIndex = -1
-    for i in range(len(flowArray)):
-        if i in excludeIndex:
-            continue
-        flow = flowArray[i]
-        duration = flow.lastArrival - flow.firstArrival
-        # initialize longest duration attributes
-        # or update flow with longest duration
-        if longestDuration == -1 or duration > longestDuration:
-            longestFlow = flow
-            longestDuration = duration
-            longestDurationIndex = i
-    return longestFlow, longestDuration, longestDurationIndex
-
-def getTopThreePacketsFlows(flowArray, getTopFunction):
-    topFlowsMetadata = []
-    topThree = []
-    topThreeIndices = []
-    for _ in range(3):
-        flow, metadata, index = getTopFunction(flowArray, topThreeIndices)
-        topThree.append(flow)
-        topThreeIndices.append(index)
-        topFlowsMetadata.append(metadata)
-    return topThree, topFlowsMetadata
-
-def _generateIpPairConnectionCounts(flowArray):
-    # (IP1, IP2) -> count
-    ipPairConnectionsCount = {}
-    # (IP1, IP2) -> list(Flow)
-    ipPairConnectionsFlows = {}
-    for flow in flowArray:
-        key = (flow.nodes[0][0], flow.nodes[1][0])
-        key2 = (flow.nodes[1][0], flow.nodes[0][0])
-        # if host pair exists
-        if key in ipPairConnectionsCount:
-            ipPairConnectionsCount[key] += 1
-            ipPairConnectionsFlows[key].append(flow)
-        # if host pair exists
-        elif key2 in ipPairConnectionsCount:
-            ipPairConnectionsCount[key2] += 1
-            ipPairConnectionsFlows[key2].append(flow)
-        # init new host pair
-        else:
-            ipPairConnectionsCount[key] = 1
-            ipPairConnectionsFlows[key] = [flow]
-    return ipPairConnectionsCount, ipPairConnectionsFlows
-
-def _getMostTcpHosts(ipPairConnectionsCount, excludePairs):
-    mostConnectionPair = None
-    mostConnectionCount = -1
-    for pair in ipPairConnectionsCount:
-        if pair in excludePairs:
-            continue
-        connectionCount = ipPairConnectionsCount[pair]
-        # initialize most connection attributes
-        # or update pair with most connections
-        if mostConnectionCount == -1 or connectionCount > mostConnectionCount:
-            mostConnectionPair = pair
-            mostConnectionCount = connectionCount
-    return mostConnectionPair, mostConnectionCount
-
-def getTopThreeTcpConnectionFlows(flowArray):
-    ipPairConnectionsCount, ipPairConnectionsFlows = _generateIpPairConnectionCounts(flowArray)
-    topThreePairs = []
-    topThreeFlows = [] # ((IP1,IP2), list(Flow))
-    topThreeCounts = []
-    for _ in range(3):
-        pair, count = _getMostTcpHosts(ipPairConnectionsCount, topThreePairs)
-        topThreePairs.append(pair)
-        topThreeFlows.append((pair, ipPairConnectionsFlows[pair]))
-        topThreeCounts.append(count)
-    return topThreeFlows, topThreeCounts
+# Return the top 3 flows of type typ by metric and their values; see FlowList.getTopFlows
+def getTopThreeFlows(flowLst, typ, metric):
+    top = flowLst.getTopFlows(typ, metric, 3)
+    return [flow for _, flow in top], [value for value, _ in top]
+
+# Return the top 3 host pairs by number of flows of type typ, as (pair, flows),
+# and their flow counts; see FlowList.getTopHostPairs
+def getTopThreeConnectionPairs(flowLst, typ):
+    top = flowLst.getTopHostPairs(typ, 3)
+    return [(pair, flows) for _, pair, flows in top], [count for count, _, _ in top]
 
 
 # ==================== RTT Helper Functions ====================
 def initSubplot(title, xlabel, ylabel):
-    global fig, ax
-    fig, ax = plt.subplots()
-    plt.title(title)
-    plt.subplots_adjust(bottom=0.15)
-    plt.xlabel(xlabel, labelpad=10)
-    plt.ylabel(ylabel, labelpad=10)
-    plt.grid(linestyle="dashed", alpha=0.75)
+    global fig
+    fig = render.Figure(title, xlabel, ylabel, grid=True, labelpad=10, bottom=0.15)
     
 def savePlot(name):
-    try:
-        fig.savefig("plots/" + name + ".png", dpi=300)
-    except:
-        os.makedirs("plots")
+    fig.save("plots/" + name + ".png")
+    # a plot without any positive value cannot be log-scaled
+    if any(np.any(y > 0) for _, y, _ in fig.lines):
+        fig.save("plots/" + name + "-log.png", yscale='log')
+    render.submit(fig)
 
-    ax.set_yscale('log')
-    try:
-        fig.savefig("plots/" + name + "-log.png", dpi=300)
-    except:
-        os.makedirs("plots")
-
-def _getPlotData(flow, packetPairs):
-    rtt_data = []
-    srtt_data = []
-    time_data = []
-    srtt = -1
-    for key in packetPairs:
-        send_pkt = flow.packets[key][0]
-        # this packet didn't receive an acknowledgement
-        if packetPairs[key] == -1:
-            continue
-        ack_pkt = flow.packets[packetPairs[key]][0]
-        # generate rtt, srtt, and time data
-        rtt = ack_pkt.time - send_pkt.time
-        if srtt == -1:
-            srtt = rtt
-        else:
-            alpha = float(1)/8
-            srtt = (1 - alpha) * srtt + alpha * rtt
-        time = send_pkt.time
-        # add data
-        rtt_data.append(rtt)
-        srtt_data.append(srtt)
-        time_data.append(time)
-    return rtt_data, srtt_data, time_data
-    
 def displayRttPlots(flows, title, metadata, unit, filename):
+    rttData = rtt.computeRtt(flows)
     for i in range(len(flows)):
-        flow = flows[i]
         value = metadata[i]
         # generate plot data
-        packetPairs = flow.getRttPacketPairs()
-        rtt_data, srtt_data, time_data = _getPlotData(flow, packetPairs)
+        rtt_data, srtt_data, time_data = rttData[i]
         
         # plot
         initSubplot(title + ' (' + str(value) + ' ' + unit + ')', 'time (ms)', 'RTT (ms)')
-        ax.plot(time_data, rtt_data, label='RTT')
-        ax.plot(time_data, srtt_data, label='Estimated RTT')
-        ax.legend()
+        fig.plot(time_data, rtt_data, 'RTT')
+        fig.plot(time_data, srtt_data, 'Estimated RTT')
+        fig.legend = True
         savePlot(filename+str(i))
-        plt.show()
 
 def displayRttIpPairs(topConnectionsPairs, topConnectionsPairsCounts, filename):
     for i in range(len(topConnectionsPairs)):
@@ -286,9 +211,10 @@ def displayRttIpPairs(topConnectionsPairs, topConnectionsPairsCounts, filename):
         # generate plot data
         med_srtt = []
         med_time_data = []
-        for flow in flows:
-            packetPairs = flow.getRttPacketPairs()
-            rtt_data, srtt_data, time_data = _getPlotData(flow, packetPairs)
+        rttData = rtt.computeRtt(flows)
+        for j in range(len(flows)):
+            flow = flows[j]
+            rtt_data, srtt_data, time_data = rttData[j]
             med_index = int(len(rtt_data) / 2 - 1)
             if len(srtt_data) == 0:
                 continue
@@ -298,5 +224,64 @@ def displayRttIpPairs(topConnectionsPairs, topConnectionsPairsCounts, filename):
             med_time_data.append(flow.firstArrival)
         # plot
         initSubplot('Top Host Pairs In Terms of TCP Connections (' + str(count) + ' connections)', 'time (ms)', 'RTT (ms)')
-        ax.plot(med_time_data, med_srtt, label='RTT')
+        fig.plot(med_time_data, med_srtt, 'RTT')
         savePlot(filename+str(i))
+
+def displayRttCDF(flows, filename):
+    # RTT samples of every TCP flow, in ms
+    samples = [data[0] * 1000 for data in rtt.computeRtt(flows) if len(data[0]) > 0]
+    initCDF('RTT CDF - All TCP Flows', 'RTT (ms)', 'Fraction of Data')
+    if (len(samples) > 0):
+        plotCDF(np.concatenate(samples), 'All samples')
+        plotCDF([np.median(data) for data in samples], 'Per-flow median')
+    displayCDF(filename)
+
+# ============================ Reports ============================
+# The outputs of perFlow_main.py and perFlow_main_RTT.py for a populated FlowList
+
+def writeFlowReports(flowLst, fName):
+    print("> Writing markdowns")
+    with instrument.stage("markdown"):
+        writeMarkdown(fName, flowLst)
+
+    print("> Writing CDFs to plots/")
+    with instrument.stage("flow CDFs"):
+        initCDF('Flow Duration CDF', 'Duration of Flow (ms)', 'Fraction of Data')
+        plotFlowMetric(flowLst, "duration")
+        displayCDF(fName + "-duration")
+
+        initCDF('Flow Size CDF - Packets', 'Number of packets', 'Fraction of Data')
+        plotFlowMetric(flowLst, "packets")
+        displayCDF(fName + "-packets")
+
+        initCDF('Flow Size CDF - Bytes', 'Flow Size (bytes)', 'Fraction of Data')
+        plotFlowMetric(flowLst, "size")
+        displayCDF(fName + "-size")
+
+        initCDF('Flow Size CDF - Overhead Ratio', 'Overhead Ratio', 'Fraction of Data')
+        plotFlowMetric(flowLst, "overhead", "TCP")
+        displayCDF(fName + "-overhead")
+
+        initCDF('Inter-Packet Arrival Time CDF', 'Inter-Arrival Time (ms)', 'Fraction of Data')
+        plotFlowMetric(flowLst, "interarrival")
+        displayCDF(fName + "-interarrival")
+
+def writeRttReports(flowLst, fName):
+    print('Finding Top 3 Flows')
+    uniqueTcpFlows = flowLst.uniqueFlows["TCP"]
+    with instrument.stage("top flows"):
+        topPacketFlows, topPacketMetadata = getTopThreeFlows(flowLst, "TCP", "packets")
+        topBytesFlows, topBytesMetadata = getTopThreeFlows(flowLst, "TCP", "bytes")
+        topDurationFlows, topDurationMetadata = getTopThreeFlows(flowLst, "TCP", "duration")
+        topConnectionsPairs, topConnectionsPairsCounts = getTopThreeConnectionPairs(flowLst, "TCP")
+    
+    print('Drawing RTT Plots')
+    with instrument.stage("RTT plots"):
+        displayRttPlots(topPacketFlows, 'Top TCP Flows In Terms of Packet Number', topPacketMetadata, 'packets', fName+'TopPacket')
+        displayRttPlots(topBytesFlows, 'Top TCP Flows In Terms of Total Bytes', topBytesMetadata, 'Bytes', fName+'TopBytes')
+        displayRttPlots(topDurationFlows, 'Top TCP Flows In Terms of Duration', topDurationMetadata, 'ms',fName+'TopDuration')
+        displayRttIpPairs(topConnectionsPairs, topConnectionsPairsCounts, fName+'TopConnections')
+
+    print('Drawing RTT CDF for all TCP flows')
+    with instrument.stage("RTT CDF"):
+        displayRttCDF(uniqueTcpFlows, fName+'-rtt')
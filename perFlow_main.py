@@ -1,63 +1,69 @@
 from perFlow import *
+import export
 
 if __name__ == '__main__':
+    # --profile: print stage timings on exit, see instrument.py
+    instrument.setup(sys.argv)
+    # -p N: draw the plots in N processes (default: all CPUs);
+    # --show: also open them in windows at the end
+    render.start_from_argv(sys.argv)
     test = 1
     if (len(sys.argv) > 1):
         if (sys.argv[1] == "-a"):
             test = 0
         if (sys.argv[1] == "-m"):
             test = 2
+    # -j N: split the flows across N worker processes
+    workers = getWorkerCount(sys.argv)
+    # --no-cache: always parse the trace instead of loading cached flows
+    useCache = not ("--no-cache" in sys.argv)
+    # --pipelined: read and decode the trace in background threads
+    pipelined = "--pipelined" in sys.argv
+    # -s: draw the inter-arrival CDF from a bounded-memory sketch
+    useSketch = "-s" in sys.argv
+    # --idle/--active/--finish S: evict flows that time out while reading
+    timeouts = getTimeouts(sys.argv)
+    # -f SOURCE: follow a capture that is still being written ('-' for stdin),
+    # rewriting the markdown every --interval S seconds (default 1)
+    follow = None
+    if ("-f" in sys.argv):
+        follow = sys.argv[sys.argv.index("-f") + 1]
+    interval = 1.0
+    if ("--interval" in sys.argv):
+        interval = float(sys.argv[sys.argv.index("--interval") + 1])
+    # --export FILE: also write one row per flow to the SQLite database FILE
+    exportPath = None
+    if ("--export" in sys.argv):
+        exportPath = sys.argv[sys.argv.index("--export") + 1]
 
     # Either parse a small test file or the large data set
     fName = ""
-    if (test == 1):
-        packetList = parser.read_test_tracefile()
+    if (follow is not None):
+        path = follow
+        fName = "perFlowLive"
+    elif (test == 1):
+        path = parser.TEST_TRACE_FILE
         fName = "perFlow1"
     elif (test == 2):
-        packetList = parser._parse_tracefile("trace_med")
+        path = "trace_med"
         fName = "perFlow_med"
     else:
-        packetList = parser.read_tracefile()
+        path = parser.TRACE_FILE
         fName = "perFlowStatistics"
         
     
-    flowLst = FlowList()
     print("> Populating flow list")
-    flowLst.populate(packetList)
-
-    print("> Writing markdowns")
-    # ============================ Markdowns ============================
-    f = open(fName + ".md", "w")
-    writeReportHeader(f)
-    writeFlowCountTable(f, flowLst)
-    writeStatesTable(f, flowLst)
-    f.close()
-
-    print("> Writing CDFs to plots/")
-    # ============================ CDF Plots ============================
-    initCDF('Flow Duration CDF', 'Duration of Flow (ms)', 'Fraction of Data')
-    plotFlow(flowLst, Flow.getDuration)
-    displayCDF(fName + "-duration")
-
-    initCDF('Flow Size CDF - Packets', 'Number of packets', 'Fraction of Data')
-    plotFlow(flowLst, Flow.getTotalPackets)
-    displayCDF(fName + "-packets")
-
-    initCDF('Flow Size CDF - Bytes', 'Flow Size (bytes)', 'Fraction of Data')
-    plotFlow(flowLst, Flow.getTotalSize)
-    displayCDF(fName + "-size")
+    if (follow is not None):
+        flowLst = followFlowList(path, fName, interval, useSketch, timeouts)
+    else:
+        flowLst = populateFlowList(path, workers, useSketch, timeouts, useCache, pipelined)
 
-    initCDF('Flow Size CDF - Overhead Ratio', 'Overhead Ratio', 'Fraction of Data')
-    plotFlow(flowLst, Flow.getOverheadRatio, "TCP")
-    displayCDF(fName + "-overhead")
+    if (exportPath is not None):
+        print("> Exporting flows to '" + exportPath + "'")
+        with instrument.stage("export"):
+            export.export_flows(flowLst, exportPath, path)
 
-    initCDF('Inter-Packet Arrival Time CDF', 'Inter-Arrival Time (ms)', 'Fraction of Data')
-    plotFlow(flowLst, Flow.getInterArrivalTimes)
-    displayCDF(fName + "-interarrival")
+    writeFlowReports(flowLst, fName)
+    render.finish()
 
     print("Per-flow analysis complete.")
-
-    # The flow list may utilize a large amount of memory, so Python may take a long time to exit.
-    # This method exits the process immediately without performing cleanup.
-    os._exit(0)
-    
\ No newline at end of file
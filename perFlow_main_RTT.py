@@ -1,38 +1,37 @@
 from perFlow import *
 
 if __name__ == '__main__':
+    # --profile: print stage timings on exit, see instrument.py
+    instrument.setup(sys.argv)
+    # -p N: draw the plots in N processes (default: all CPUs);
+    # --show: also open them in windows at the end
+    render.start_from_argv(sys.argv)
     test = 0
     if (len(sys.argv) > 1):
         if (sys.argv[1] == "-a"):
             test = 0
         if (sys.argv[1] == "-m"):
             test = 2
+    # -j N: split the flows across N worker processes
+    workers = getWorkerCount(sys.argv)
+    # --no-cache: always parse the trace instead of loading cached flows
+    useCache = not ("--no-cache" in sys.argv)
+    # --pipelined: read and decode the trace in background threads
+    pipelined = "--pipelined" in sys.argv
 
     # Either parse a small test file or the large data set
     fName = ""
     if (test == 1):
-        packetList = parser.read_test_tracefile()
+        path = parser.TEST_TRACE_FILE
         fName = "RTT_small"
     elif (test == 2):
-        packetList = parser._parse_tracefile("trace_med")
+        path = "trace_med"
         fName = "RTT_med"
     else:
-        packetList = parser.read_tracefile()
+        path = parser.TRACE_FILE
         fName = "RTTStatistics"
     
-    flowLst = FlowList()
-    flowLst.populate(packetList)
+    flowLst = populateFlowList(path, workers, useCache=useCache, pipelined=pipelined)
 
-    # =============================== RTT ===============================
-    print('Finding Top 3 Flows')
-    uniqueTcpFlows = flowLst.uniqueFlows["TCP"]
-    topPacketFlows, topPacketMetadata = getTopThreePacketsFlows(uniqueTcpFlows, getMostPacketsFlows)
-    topBytesFlows, topBytesMetadata = getTopThreePacketsFlows(uniqueTcpFlows, getMostBytesFlows)
-    topDurationFlows, topDurationMetadata = getTopThreePacketsFlows(uniqueTcpFlows, getLongestDurationFlows)
-    topConnectionsPairs, topConnectionsPairsCounts = getTopThreeTcpConnectionFlows(uniqueTcpFlows)
-    
-    print('Drawing RTT Plots')
-    displayRttPlots(topPacketFlows, 'Top TCP Flows In Terms of Packet Number', topPacketMetadata, 'packets', fName+'TopPacket')
-    displayRttPlots(topBytesFlows, 'Top TCP Flows In Terms of Total Bytes', topBytesMetadata, 'Bytes', fName+'TopBytes')
-    displayRttPlots(topDurationFlows, 'Top TCP Flows In Terms of Duration', topDurationMetadata, 'ms',fName+'TopDuration')
-    displayRttIpPairs(topConnectionsPairs, topConnectionsPairsCounts, fName+'TopConnections')
\ No newline at end of file
+    writeRttReports(flowLst, fName)
+    render.finish()
@@ -1,8 +1,13 @@
 import trace_parser as parser
+import decoder
+import sketch
+import cache
+import instrument
+import render
 from layer import Layer
 import numpy as np
-from matplotlib import pyplot as plt
-import os
+import itertools
+import sys
 
 
 layer_names = {0:'Link', 2:'Network', 3:'Transport'}
@@ -10,6 +15,12 @@ packet_types = {0:{'Ethernet'},
                        2:{'IPv4', 'IPv6', 'ICMP', 'ARP'},
                        3:{'TCP', 'UDP'}}
 layer_list = {} # dictionary of Layer objects
+_figure = None # render.Figure being built
+
+# Packets classified at a time by analyze_records
+BATCH_SIZE = 4096
+_layer_classes = {} # (layers, IP protocol) of a packet -> index in _class_entries
+_class_entries = [] # (depth, name, header size) entries each class adds to layer_list
 
 # ======================== Per-Packet Type Analysis ========================
 
@@ -35,8 +46,8 @@ def _list_all_packet_sizes():
         layer = layer_list[key]
         sizes_dict = layer.get_packet_sizes_list()
         for key2 in sizes_dict:
-            all_sizes += sizes_dict[key2]
-    return all_sizes
+            all_sizes.append(sizes_dict[key2])
+    return sketch.combine(all_sizes)
 
 def _list_packet_sizes(plot_packet):
     # search for given packet in layers
@@ -47,23 +58,18 @@ def _list_packet_sizes(plot_packet):
             return packet_sizes[plot_packet]
     return []
 
+# data is either a list of sizes or a histogram from the sketch module
 def _generate_plot(data, name):
-    x = np.sort(data)
-    y = np.arange(1,len(x)+1) / len(x)
-    plt.plot(x,y, label=name)
+    x, y = sketch.cdf_points(data)
+    _figure.plot(x, y, name)
 
 def _generate_cdf_graphs(add_graph_line, layer):
-    plt.title('Packet Size CDF: ' + layer)
-    plt.xlabel('Packet Size (Bytes)')
-    plt.ylabel('Fraction of Data')
+    global _figure
+    _figure = render.Figure('Packet Size CDF: ' + layer, 'Packet Size (Bytes)', 'Fraction of Data')
     add_graph_line()
-    plt.xscale('log')
-    plt.legend()
-    try:
-        plt.savefig("plots/perPacketStatistics-" + str(layer.lower()) + "-packetsize-log.png", dpi=300)
-    except:
-        os.makedirs("plots")
-    plt.show()
+    _figure.legend = True
+    _figure.save("plots/perPacketStatistics-" + str(layer.lower()) + "-packetsize-log.png", xscale='log')
+    render.submit(_figure)
         
 def _add_all_packets_graph_line():
     all_sizes = _list_all_packet_sizes()
@@ -76,9 +82,9 @@ def _add_non_packets_graph_line():
     for name in packet_sizes:
         if name == 'IPv4' or name == 'IPv6':
             continue
-        data += packet_sizes[name]
+        data.append(packet_sizes[name])
     
-    _generate_plot(data, 'Non-IP')
+    _generate_plot(sketch.combine(data), 'Non-IP')
 
 def add_transport_layer_graph_lines():
     _add_all_packets_graph_line()
@@ -120,96 +126,139 @@ def _add_header_graph_lines():
         _generate_plot(data, plot)
 
 def generate_cdf_header_graphs():
-    plt.title('Packet Header Size CDF')
-    plt.xlabel('Packet Size (Bytes)')
-    plt.ylabel('Fraction of Data')
+    global _figure
+    _figure = render.Figure('Packet Header Size CDF', 'Packet Size (Bytes)', 'Fraction of Data')
     _add_header_graph_lines()
-    plt.legend()
-    try:
-        plt.savefig("plots/perPacketStatistics-headersize.png", dpi=300)
-    except:
-        os.makedirs("plots")
-    plt.show()
+    _figure.legend = True
+    _figure.save("plots/perPacketStatistics-headersize.png")
+    render.submit(_figure)
 
 # ========================== Trace File Analysis ==========================
 
-def _init_layers_analysis():
+def _init_layers_analysis(use_sketch=False):
     # Initialize layers analysis objects
     for layer_id in packet_types:
-        layer = Layer(layer_names[layer_id], packet_types[layer_id])
+        layer = Layer(layer_names[layer_id], packet_types[layer_id], use_sketch)
         layer_list[layer_id] = layer
 
-def _get_packet_name(pkt):
-    name = pkt.name
-    if name == 'IP':
-        name += 'v' + str(pkt.version)
-    return name
-
-def _record_packet(pkt_layer, depth, packet_size):
-    header_size = len(pkt_layer) - len(pkt_layer.payload)
-    # Link layer
-    if depth == 0:
-        layer = layer_list[depth]
-        layer.add_packet_occurrence('Ethernet', packet_size, header_size)
-        return
-    pkt_name = _get_packet_name(pkt_layer)
-    layer = layer_list[depth]
-    layer.add_packet_occurrence(pkt_name, packet_size, header_size)
-
-def _compute_packet_size(packet):
-    try:
-        return len(packet) - len(packet.payload.payload) + packet.len
-    except AttributeError:
-        return len(packet)
-
-def analyze_packets(packetList):
-    _init_layers_analysis()
-    
-    # Analyze trace file
-    for packet in packetList:
-        packet_size = _compute_packet_size(packet)
-        
-        # Iterate each layer of packet
-        pkt_layer = packet
-        depth = 0
-        while pkt_layer:
-            pkt_name = _get_packet_name(pkt_layer)
-            # record all link layer packets as 'Ethernet'
-            if depth == 0:
-                _record_packet(pkt_layer, depth, packet_size)
-                if depth == 0 and pkt_name != 'Ethernet':
-                    depth += 1 # this packet has no second link layer
-            elif depth == 2:
-                if pkt_name == 'IPv4' or pkt_name == 'IPv6':
-                    # ICMP protocol
-                    if pkt_name != 'IPv6' and pkt_layer.proto == 1:
-                        _record_packet(pkt_layer.payload, depth, packet_size)
-                        break # no transport layer in ICMP
-                    # Record IP packet info
-                    else:
-                        _record_packet(pkt_layer, depth, packet_size)
-                # Non-IP packet types
+# The (depth, name, header size) entries that a packet with these layers and
+# IP protocol adds to the layer tables
+def _classify(layers, proto):
+    entries = []
+    depth = 0
+    for i in range(len(layers)):
+        pkt_name, header_size = layers[i]
+        # record all link layer packets as 'Ethernet'
+        if depth == 0:
+            entries.append((depth, 'Ethernet', header_size))
+            if pkt_name != 'Ethernet':
+                depth += 1 # this packet has no second link layer
+        elif depth == 2:
+            if pkt_name == 'IPv4' or pkt_name == 'IPv6':
+                # ICMP protocol
+                if pkt_name != 'IPv6' and proto == 1:
+                    if i + 1 < len(layers):
+                        entries.append((depth,) + layers[i + 1])
+                    break # no transport layer in ICMP
+                # Record IP packet info
                 else:
-                    _record_packet(pkt_layer, depth, packet_size)
-                    break # Don't record transport protocol for Non-IP packets
-            elif depth == 3:
-                if pkt_name == 'Raw':
-                    break
-                _record_packet(pkt_layer, depth, packet_size)
-            
-            # loop logic
-            pkt_layer = pkt_layer.payload
-            depth += 1
+                    entries.append((depth, pkt_name, header_size))
+            # Non-IP packet types
+            else:
+                entries.append((depth, pkt_name, header_size))
+                break # Don't record transport protocol for Non-IP packets
+        elif depth == 3:
+            if pkt_name == 'Raw':
+                break
+            entries.append((depth, pkt_name, header_size))
+
+        # loop logic
+        depth += 1
+    return tuple(entries)
+
+def _class_of(key):
+    _layer_classes[key] = len(_class_entries)
+    _class_entries.append(_classify(*key))
+    return _layer_classes[key]
+
+# With use_sketch=True, packet and header sizes are accumulated in
+# bounded-memory sketches and the CDFs are drawn from them
+def analyze_packets(packetList, use_sketch=False):
+    _init_layers_analysis(use_sketch)
+    analyze_records(packetList)
+
+# Add packets to the current layers analysis, BATCH_SIZE at a time
+def analyze_records(packetList):
+    packets = iter(packetList)
+    while True:
+        batch = list(itertools.islice(packets, BATCH_SIZE))
+        if len(batch) == 0:
+            return
+        analyze_batch(batch)
+
+# Add a list of packets to the current layers analysis. Packets with the same
+# layers and IP protocol add the same entries to the layer tables, so each
+# such class is worked out once and its packets are added together.
+def analyze_batch(packets):
+    classes = _layer_classes
+    ids = []
+    sizes = []
+    for packet in packets:
+        record = decoder.as_record(packet)
+        key = (record.layers, record.proto)
+        class_id = classes.get(key)
+        if class_id is None:
+            class_id = _class_of(key)
+        ids.append(class_id)
+        sizes.append(record.size)
+
+    ids = np.array(ids, dtype=np.intp)
+    sizes = np.array(sizes, dtype=np.int64)
+    # the sizes of each class, one class after another
+    counts = np.bincount(ids)
+    sizes = sizes[np.argsort(ids, kind='stable')]
+    ends = np.cumsum(counts)
+    for class_id in np.flatnonzero(counts).tolist():
+        class_sizes = sizes[ends[class_id] - counts[class_id]:ends[class_id]]
+        for depth, name, header_size in _class_entries[class_id]:
+            layer_list[depth].add_packets(name, class_sizes, header_size)
+
+def write_reports():
+    with instrument.stage('tables'):
+        print_types_tables()
+        print_markdown_types_tables()
+    with instrument.stage('packet CDFs'):
+        generate_cdf_graphs()
+        generate_cdf_header_graphs()
+
+# Analyze the trace at path; with use_cache, the exact (non-sketch) results
+# are loaded from and saved to the trace cache, see cache.py. With pipelined,
+# the trace is read and decoded in threads ahead of the analysis, see ingest.py
+def analyze_tracefile(path, use_sketch=False, use_cache=True, pipelined=False):
+    use_cache = use_cache and not use_sketch
+    if use_cache:
+        _init_layers_analysis()
+        with instrument.stage('cache load'):
+            loaded = cache.load_layers(path, layer_list)
+        if loaded:
+            print("> Loaded layers of '" + path + "' from cache")
+            return
+    with instrument.stage('analyze packets'):
+        analyze_packets(instrument.timed_iter('parse', parser._parse_tracefile(path, decode=True, pipelined=pipelined)), use_sketch)
+    if use_cache:
+        with instrument.stage('cache save'):
+            cache.save_layers(path, layer_list)
 
 if __name__ == '__main__':
-    # Parse trace data
-#    packet_list = parser.read_test_tracefile()
-    packet_list = parser.read_tracefile()
-    
-    # Analysis
-    analyze_packets(packet_list);
-    print_types_tables()
-    print_markdown_types_tables()
-    generate_cdf_graphs()
-    generate_cdf_header_graphs()
+    # Parse trace data and analyze it
+    # (-s: draw the CDFs from sketches; --no-cache: always parse the trace;
+    #  --profile: print stage timings, see instrument.py;
+    #  -p N/--show: plot rendering, see render.start_from_argv;
+    #  --pipelined: read and decode the trace in background threads)
+    instrument.setup(sys.argv)
+    render.start_from_argv(sys.argv)
+#    analyze_tracefile(parser.TEST_TRACE_FILE, '-s' in sys.argv, '--no-cache' not in sys.argv, '--pipelined' in sys.argv)
+    analyze_tracefile(parser.TRACE_FILE, '-s' in sys.argv, '--no-cache' not in sys.argv, '--pipelined' in sys.argv)
+    write_reports()
+    render.finish()
     
\ No newline at end of file
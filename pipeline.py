@@ -0,0 +1,212 @@
+import itertools
+
+import cache
+import export
+import instrument
+import perPacket
+import trace_parser as parser
+import window
+from perFlow import *
+
+# Records handed to the analyzers at a time
+BATCH_SIZE = 4096
+
+# ======================== Analyzers ========================
+# An analyzer takes every decoded packet of the trace in add(records) and
+# writes its outputs in report(fName). load/save restore and store its
+# results with cache.py; load returns False when they have to be computed.
+
+class LayerAnalyzer:
+    """
+    Per-packet Layer accounting of perPacket.py.
+    """
+    def __init__(self, use_sketch=False):
+        self.use_sketch = use_sketch
+        perPacket._init_layers_analysis(use_sketch)
+
+    def load(self, path):
+        return not self.use_sketch and cache.load_layers(path, perPacket.layer_list)
+
+    def save(self, path):
+        if not self.use_sketch:
+            cache.save_layers(path, perPacket.layer_list)
+
+    def add(self, records):
+        perPacket.analyze_records(records)
+
+    def report(self, fName):
+        perPacket.write_reports()
+
+class FlowAnalyzer:
+    """
+    Flow table and per-flow reports of perFlow_main.py.
+    """
+    def __init__(self, useSketch=False, timeouts=None):
+        if (timeouts is None):
+            timeouts = {}
+        self.cacheable = not useSketch and len(timeouts) == 0
+        self.flowLst = FlowList(useSketch, **timeouts)
+
+    def load(self, path):
+        if not self.cacheable:
+            return False
+        flowLst = cache.load_flows(path)
+        if flowLst is None:
+            return False
+        self.flowLst = flowLst
+        return True
+
+    def save(self, path):
+        if self.cacheable:
+            cache.save_flows(path, self.flowLst)
+
+    def add(self, records):
+        self.flowLst.populate(records)
+
+    def report(self, fName):
+        writeFlowReports(self.flowLst, fName)
+
+class RttAnalyzer:
+    """
+    RTT reports of perFlow_main_RTT.py; the RTT samples come from the packet
+    columns the flow table keeps, so it needs no packets of its own.
+    """
+    def __init__(self, flows):
+        self.flows = flows
+
+    def load(self, path):
+        return True
+
+    def save(self, path):
+        pass
+
+    def add(self, records):
+        pass
+
+    def report(self, fName):
+        writeRttReports(self.flows.flowLst, fName + "-RTT")
+
+class WindowAnalyzer:
+    """
+    Per-window statistics of window.py, written to fName-windows.csv and
+    plotted; they are not cached, so the trace is read whenever they are on.
+    """
+    def __init__(self, width, step=None):
+        self.stats = window.WindowStats(width, step)
+
+    def load(self, path):
+        return False
+
+    def save(self, path):
+        pass
+
+    def add(self, records):
+        self.stats.add(records)
+
+    def report(self, fName):
+        windows = self.stats.finish()
+        window.write_csv(windows, fName + "-windows.csv")
+        window.plot_windows(windows, fName + "-windows", self.stats.width)
+
+class ExportAnalyzer:
+    """
+    Writes the flows of a FlowAnalyzer to an SQLite database; see export.py.
+    """
+    def __init__(self, flows, dbPath, trace=None):
+        self.flows = flows
+        self.dbPath = dbPath
+        self.trace = trace
+
+    def load(self, path):
+        return True
+
+    def save(self, path):
+        pass
+
+    def add(self, records):
+        pass
+
+    def report(self, fName):
+        export.export_flows(self.flows.flowLst, self.dbPath, self.trace)
+
+# ======================== Driver ========================
+
+# Read the trace at path once, handing every packet to all analyzers, then
+# write the reports of each analyzer. With use_cache, analyzers whose results
+# are cached skip the trace, which is not read at all if every one of them hits.
+# With pipelined, the trace is read and decoded in threads while the analyzers
+# work on the previous batches, see ingest.py.
+def run(path, fName, analyzers, use_cache=True, pipelined=False):
+    pending = analyzers
+    if use_cache:
+        with instrument.stage("cache load"):
+            pending = [analyzer for analyzer in analyzers if not analyzer.load(path)]
+
+    if len(pending) > 0:
+        records = iter(instrument.timed_iter("parse", parser._parse_tracefile(path, decode=True, pipelined=pipelined)))
+        while True:
+            batch = list(itertools.islice(records, BATCH_SIZE))
+            if len(batch) == 0:
+                break
+            for analyzer in pending:
+                with instrument.stage(type(analyzer).__name__):
+                    analyzer.add(batch)
+        if use_cache:
+            with instrument.stage("cache save"):
+                for analyzer in pending:
+                    analyzer.save(path)
+
+    for analyzer in analyzers:
+        with instrument.stage(type(analyzer).__name__ + " report"):
+            analyzer.report(fName)
+
+if __name__ == '__main__':
+    # --profile: print stage timings on exit, see instrument.py
+    instrument.setup(sys.argv)
+    # -p N: draw the plots in N processes (default: all CPUs);
+    # --show: also open them in windows at the end
+    render.start_from_argv(sys.argv)
+    test = 1
+    if (len(sys.argv) > 1):
+        if (sys.argv[1] == "-a"):
+            test = 0
+        if (sys.argv[1] == "-m"):
+            test = 2
+    # -s: draw the CDFs from bounded-memory sketches
+    useSketch = "-s" in sys.argv
+    # --idle/--active/--finish S: evict flows that time out while reading
+    timeouts = getTimeouts(sys.argv)
+    # --no-cache: always parse the trace
+    useCache = not ("--no-cache" in sys.argv)
+    # --pipelined: read and decode the trace in background threads
+    pipelined = "--pipelined" in sys.argv
+    # --width S [--step S]: also write statistics per window of S seconds
+    # (sliding every --step S seconds), see window.py
+    windowed = "--width" in sys.argv
+    # --export FILE: also write one row per flow to the SQLite database FILE
+    exportPath = None
+    if ("--export" in sys.argv):
+        exportPath = sys.argv[sys.argv.index("--export") + 1]
+
+    # Either parse a small test file or the large data set
+    fName = ""
+    if (test == 1):
+        path = parser.TEST_TRACE_FILE
+        fName = "report1"
+    elif (test == 2):
+        path = "trace_med"
+        fName = "report_med"
+    else:
+        path = parser.TRACE_FILE
+        fName = "reportStatistics"
+
+    flows = FlowAnalyzer(useSketch, timeouts)
+    analyzers = [LayerAnalyzer(useSketch), flows, RttAnalyzer(flows)]
+    if (windowed):
+        analyzers.append(WindowAnalyzer(*window.get_window(sys.argv)))
+    if (exportPath is not None):
+        analyzers.append(ExportAnalyzer(flows, exportPath, path))
+    run(path, fName, analyzers, useCache, pipelined)
+    instrument.count_flows(flows.flowLst)
+    render.finish()
+    print("Analysis complete.")
@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+
+import numpy as np
+from matplotlib.figure import Figure as _MplFigure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import instrument
+
+# ======================== Plot Rendering ========================
+# The report scripts describe every plot as a Figure (title, labels, lines
+# and the files to save it to) and hand it to submit(). Figures are drawn
+# with matplotlib's object-oriented Agg API, which keeps no global state, so
+# after start(workers) they are drawn and PNG-encoded by a pool of worker
+# processes while the report goes on; finish() waits for them. Without
+# start() every figure is drawn as soon as it is submitted.
+#
+# Rendering is headless: nothing waits on pyplot.show(). With
+# start(show=True), finish() also opens the figures in pyplot windows.
+
+DPI = 300
+
+class Figure:
+    """
+    A plot to draw: lines of (x, y, label), drawn once for every
+    save(path, xscale, yscale).
+    """
+    def __init__(self, title, xlabel, ylabel, grid=False, labelpad=None, bottom=None):
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.grid = grid
+        self.labelpad = labelpad
+        self.bottom = bottom
+        self.legend = False
+        self.lines = []
+        self.outputs = []
+
+    def plot(self, x, y, label=None):
+        self.lines.append((np.asarray(x), np.asarray(y), label))
+
+    def save(self, path, xscale='linear', yscale='linear'):
+        self.outputs.append((path, xscale, yscale))
+
+def _draw_into(fig, spec):
+    ax = fig.add_subplot()
+    ax.set_title(spec.title)
+    if spec.bottom is not None:
+        fig.subplots_adjust(bottom=spec.bottom)
+    ax.set_xlabel(spec.xlabel, labelpad=spec.labelpad)
+    ax.set_ylabel(spec.ylabel, labelpad=spec.labelpad)
+    if spec.grid:
+        ax.grid(linestyle="dashed", alpha=0.75)
+    for x, y, label in spec.lines:
+        ax.plot(x, y, label=label)
+    if spec.legend:
+        ax.legend()
+    return ax
+
+# Draw spec and save it to each of its outputs
+def draw(spec):
+    fig = _MplFigure()
+    FigureCanvasAgg(fig)
+    ax = _draw_into(fig, spec)
+    for path, xscale, yscale in spec.outputs:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        ax.set_xscale(xscale)
+        ax.set_yscale(yscale)
+        fig.savefig(path, dpi=DPI)
+    return [path for path, _, _ in spec.outputs]
+
+# ======================== Render Pool ========================
+
+_pool = None
+_pending = []
+_show = False
+_shown = []
+
+# Draw the figures submitted from now on in worker processes (all CPUs by
+# default; 0 or 1 draws them in this process)
+def start(workers=None, show=False):
+    global _pool, _show
+    _show = show
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and _pool is None:
+        _pool = multiprocessing.Pool(workers)
+
+def submit(spec):
+    if _show:
+        _shown.append(spec)
+    if _pool is None:
+        with instrument.stage("render"):
+            draw(spec)
+    else:
+        _pending.append(_pool.apply_async(draw, (spec,)))
+
+# Wait for every submitted figure to be saved and stop the workers
+def finish():
+    global _pool, _pending, _shown
+    with instrument.stage("render wait"):
+        for result in _pending:
+            result.get()
+        if _pool is not None:
+            _pool.close()
+            _pool.join()
+    _pool = None
+    _pending = []
+
+    if len(_shown) > 0:
+        from matplotlib import pyplot as plt
+        for spec in _shown:
+            ax = _draw_into(plt.figure(), spec)
+            if len(spec.outputs) > 0:
+                ax.set_xscale(spec.outputs[-1][1])
+                ax.set_yscale(spec.outputs[-1][2])
+        _shown = []
+        plt.show()
+
+# -p N: number of processes drawing plots (default: all CPUs)
+# --show: open the plots in windows once they are all saved
+def start_from_argv(argv):
+    workers = None
+    if "-p" in argv:
+        workers = int(argv[argv.index("-p") + 1])
+    start(workers, "--show" in argv)
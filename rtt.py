@@ -0,0 +1,257 @@
+from array import array
+
+import numpy as np
+
+# Weight of a new RTT sample in the smoothed RTT estimate
+ALPHA = float(1)/8
+
+# Samples per block when computing the smoothed RTT
+_BLOCK = 64
+
+# ==================== Sequence-Space Tracking ====================
+# RTT samples are taken the way the sender of a TCP flow takes them: a
+# segment is outstanding from when it is sent until an ACK covers its last
+# sequence number, and an ACK that ends exactly at the last segment it covers
+# gives one sample. Segments sent more than once give no sample (Karn's
+# algorithm), as it is not known which copy was acknowledged. Sequence numbers
+# compare modulo 2^32, so flows may wrap around.
+
+# Segments kept outstanding per direction of a flow; beyond this (e.g. when
+# the ACKs of a flow are not in the capture) the oldest are dropped
+MAX_OUTSTANDING = 1024
+
+_FIN = 0x01
+_SYN = 0x02
+_ACK = 0x10
+
+_SEQ_MASK = 0xFFFFFFFF
+_SEQ_HALF = 1 << 31
+
+# Signed distance from sequence number b to a
+def _seqDiff(a, b):
+    return ((a - b + _SEQ_HALF) & _SEQ_MASK) - _SEQ_HALF
+
+class RttTracker:
+    """
+    Streaming RTT estimator of one TCP flow; feed it the packets of the flow
+    in capture order with add(). Only the segments each side has in flight
+    are kept, as (sequence number that acknowledges it, send time in ns,
+    first sequence number, retransmitted) in the order they were sent.
+
+    Instance variables
+    self.samples: array('d')
+        RTT samples in seconds, in the order they were taken; None if samples
+        are not kept
+    self.sendTimes: array('q')
+        the exact send times (ns) of the sampled segments; None if samples
+        are not kept
+    self.retransmissions: int
+        segments that started below the highest sequence number already sent
+        (retransmitted, or reordered before the capture point)
+    """
+    __slots__ = ("samples", "sendTimes", "retransmissions", "_outstanding", "_sndMax")
+
+    def __init__(self, keepSamples=True):
+        self.samples = array("d") if keepSamples else None
+        self.sendTimes = array("q") if keepSamples else None
+        self.retransmissions = 0
+        self._outstanding = ([], [])
+        # highest sequence number sent so far, per direction
+        self._sndMax = [None, None]
+
+    # Add the packet sent at time (exact, in ns) in direction (0 or 1, fixed
+    # per flow side) with TCP flags, seq, ack and length bytes of segment
+    # data; return its RTT sample in seconds if it gives one, else None
+    def add(self, direction, time, flags, seq, ack, length):
+        sample = None
+        if (flags & _ACK):
+            # remove the segments of the other side that ack covers (cumulatively)
+            outstanding = self._outstanding[1 - direction]
+            if (outstanding):
+                first = outstanding[0]
+                if (ack == first[0]):
+                    del outstanding[0]
+                    segment = first
+                elif (((ack - first[0] + _SEQ_HALF) & _SEQ_MASK) >= _SEQ_HALF):
+                    count = len(outstanding)
+                    covered = 1
+                    while (covered < count and ((ack - outstanding[covered][0] + _SEQ_HALF) & _SEQ_MASK) >= _SEQ_HALF):
+                        covered += 1
+                    segment = outstanding[covered - 1]
+                    del outstanding[:covered]
+                else:
+                    segment = None
+                if (segment is not None and segment[0] == ack and not segment[3]):
+                    sample = (time - segment[1]) / 1000000000
+                    if (self.samples is not None):
+                        self.samples.append(sample)
+                        self.sendTimes.append(segment[1])
+
+        # SYN and FIN take one sequence number each
+        if (flags & (_SYN | _FIN)):
+            length += (flags & _FIN) + ((flags & _SYN) >> 1)
+        if (length > 0):
+            end = (seq + length) & _SEQ_MASK
+            sndMax = self._sndMax[direction]
+            if (seq == sndMax or sndMax is None or _seqDiff(seq, sndMax) > 0):
+                self._append(direction, (end, time, seq, False))
+            else:
+                self._retransmit(direction, time, seq, end, sndMax)
+        return sample
+
+    def _append(self, direction, segment):
+        outstanding = self._outstanding[direction]
+        outstanding.append(segment)
+        self._sndMax[direction] = segment[0]
+        if (len(outstanding) > MAX_OUTSTANDING):
+            del outstanding[0]
+
+    # A segment from seq to end that starts below sndMax
+    def _retransmit(self, direction, time, seq, end, sndMax):
+        self.retransmissions += 1
+        outstanding = self._outstanding[direction]
+        # the copies of the outstanding segments it overlaps are ambiguous
+        for i in range(len(outstanding)):
+            segment = outstanding[i]
+            if (_seqDiff(segment[2], end) >= 0):
+                break
+            if (_seqDiff(segment[0], seq) > 0):
+                outstanding[i] = segment[:3] + (True,)
+        if (_seqDiff(end, sndMax) > 0):
+            # also carries new data
+            self._append(direction, (end, time, sndMax, True))
+
+# Concatenate one array column of every flow; joining the raw buffers is much
+# cheaper than wrapping each flow's column in a numpy array first
+def _join(columns, dtype):
+    return np.frombuffer(b"".join(columns), dtype=dtype)
+
+# The RTT samples of every flow, concatenated: (flow of each sample, RTT in
+# seconds, send time in seconds, samples per flow)
+def _samples(flows):
+    trackers = [flow.rtt for flow in flows]
+    counts = np.array([len(tracker.samples) for tracker in trackers], dtype=np.int64)
+    sampleFlows = np.repeat(np.arange(len(flows), dtype=np.int64), counts)
+    rtt = _join([tracker.samples for tracker in trackers], np.float64)
+    sendTimes = _join([tracker.sendTimes for tracker in trackers], np.int64) / 1e9
+    return sampleFlows, rtt, sendTimes, counts
+
+# ==================== Smoothed RTT ====================
+
+# Exponentially weighted moving average over each segment of values.
+# The first value of each segment starts a new estimate.
+def _smooth(values, segmentIds, alpha=ALPHA):
+    if len(values) == 0:
+        return np.zeros(0)
+    decay = 1 - alpha
+
+    # position of each sample within its segment, split into fixed-size blocks
+    starts = np.flatnonzero(np.r_[True, segmentIds[1:] != segmentIds[:-1]])
+    lengths = np.diff(np.r_[starts, len(values)])
+    position = np.arange(len(values)) - np.repeat(starts, lengths)
+    segmentBlocks = (lengths + _BLOCK - 1) // _BLOCK
+    firstBlock = np.r_[0, np.cumsum(segmentBlocks)[:-1]]
+    blockIndex = position // _BLOCK
+    block = np.repeat(firstBlock, lengths) + blockIndex
+    offset = position % _BLOCK
+
+    # average within each block as if the estimate entering it were zero
+    grid = np.zeros((segmentBlocks.sum(), _BLOCK))
+    grid[block, offset] = values
+    k = np.arange(_BLOCK)
+    weights = np.tril(alpha * decay ** (k[:, None] - k[None, :]))
+    local = grid @ weights.T
+
+    # carry the estimate across the blocks of each segment; the first block of
+    # a segment enters with its first value, which makes srtt[0] == rtt[0]
+    carry = np.zeros(len(grid))
+    carry[firstBlock] = values[starts]
+    blockDecay = decay ** _BLOCK
+    for b in range(1, segmentBlocks.max()):
+        cur = firstBlock[segmentBlocks > b] + b
+        carry[cur] = local[cur - 1, -1] + blockDecay * carry[cur - 1]
+
+    smoothed = local + decay ** (k + 1) * carry[:, None]
+    return smoothed[block, offset]
+
+# ==================== RTT Engine ====================
+
+# Gather the RTT samples that every given TCP flow took while its packets
+# were added. Return a list with one (rtt_data, srtt_data, time_data) tuple
+# of numpy arrays per flow: the samples in seconds, their smoothed estimate
+# and the send times of the sampled segments.
+def computeRtt(flows):
+    if len(flows) == 0:
+        return []
+    sampleFlows, rtt, sendTimes, counts = _samples(flows)
+    srtt = _smooth(rtt, sampleFlows)
+
+    splits = np.cumsum(counts)[:-1]
+    return list(zip(np.split(rtt, splits), np.split(srtt, splits), np.split(sendTimes, splits)))
+
+# Summarize the RTT samples of every given TCP flow, in ms.
+# Return a dict of per-flow arrays: "samples" (count), "min", "median", "mean",
+# "max" and "srtt" (the last smoothed estimate); flows without samples get NaN.
+def summarizeRtt(flows):
+    count = len(flows)
+    summary = dict((name, np.full(count, np.nan)) for name in ("min", "median", "mean", "max", "srtt"))
+    summary["samples"] = np.zeros(count, dtype=np.int64)
+    if count == 0:
+        return summary
+    sampleFlows, rtt, _, counts = _samples(flows)
+    if len(rtt) == 0:
+        return summary
+
+    # samples are grouped by flow, in the order they were taken
+    rtt = rtt * 1000
+    srtt = _smooth(rtt, sampleFlows)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    has = counts > 0
+
+    ordered = rtt[np.lexsort((rtt, sampleFlows))]
+    summary["samples"] = counts
+    summary["min"][has] = ordered[starts[has]]
+    summary["max"][has] = ordered[ends[has] - 1]
+    summary["median"][has] = (ordered[(starts + (counts - 1) // 2)[has]] + ordered[(starts + counts // 2)[has]]) / 2
+    summary["mean"][has] = np.bincount(sampleFlows, rtt, count)[has] / counts[has]
+    summary["srtt"][has] = srtt[ends[has] - 1]
+    return summary
+
+# ==================== Streaming Tracking ====================
+
+class RttStream:
+    """
+    Tracks the RTT of TCP flows as their packets arrive, like the RttTracker
+    of each Flow, and returns each RTT sample as soon as its ACK is seen.
+
+    Only the in-flight segments of recent flows are kept: the state of a
+    flow is dropped once it has had no packet for between idleTimeout and
+    twice idleTimeout seconds of packet time.
+    """
+    def __init__(self, idleTimeout=300.0):
+        self.idleTimeout = idleTimeout
+        # flow key -> RttTracker, in two generations; flows not seen for a
+        # whole generation are dropped
+        self._current = {}
+        self._previous = {}
+        self._rotateAt = None
+
+    # Add the packet of flow key sent at time (in ns) in direction (0 or 1,
+    # fixed per flow side), see RttTracker.add; return its RTT sample in seconds if it
+    # gives one, else None
+    def add(self, key, direction, time, flags, seq, ack, length):
+        if (self._rotateAt is None):
+            self._rotateAt = time + self.idleTimeout * 1000000000
+        elif (time >= self._rotateAt):
+            self._previous = self._current
+            self._current = {}
+            self._rotateAt = time + self.idleTimeout * 1000000000
+
+        tracker = self._current.get(key)
+        if (tracker is None):
+            tracker = self._previous.pop(key, None)
+            if (tracker is None):
+                tracker = RttTracker(keepSamples=False)
+            self._current[key] = tracker
+        return tracker.add(direction, time, flags, seq, ack, length)
@@ -0,0 +1,204 @@
+import itertools
+import mmap
+import multiprocessing
+import queue
+
+import numpy as np
+
+import cache
+import decoder
+import ingest
+from flow import FlowList
+
+# ======================== Sharded Flow Analysis ========================
+# The parent process reads the trace once and splits its packets into shards
+# by a direction-independent hash of their flow, computed with numpy straight
+# from the frame bytes (see decoder.frame_shards). Every worker process only
+# gets the packets of its shard:
+#
+#   plain pcap file   the offsets and timestamps of its records, read from the
+#                     worker's own mmap of the file
+#   anything else     the raw frames (segments are decompressed and merged in
+#                     timestamp order by the parent, see ingest.read_frames)
+#
+# Workers decode and track their packets, then send back their flows as
+# numpy columns (see cache.flow_columns) next to an otherwise empty FlowList
+# with their aggregates. The shards hold disjoint sets of flows, so merging
+# them gives the single-process result.
+#
+# The parent decodes only the frames whose flow is not clear from the bytes
+# alone (tunnels, IPv6 extension headers, other link types) to find their
+# shard; frames of no flow are not sent anywhere.
+
+# Packets split at a time
+SPLIT_SIZE = 1 << 15
+# Batches waiting for each worker
+QUEUE_DEPTH = 4
+# Seconds between checks whether a worker died
+_POLL = 0.1
+
+def _plainPcap(path):
+    if not (ingest.is_plain_trace(path)):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(4) in decoder._PCAP_MAGIC
+
+# Worker process body: populate a FlowList with the batches of inbox up to
+# None, then put (index, FlowList, flow columns) or (index, error) on outbox
+def _populateShard(path, plain, index, inbox, outbox, sketch, timeouts):
+    try:
+        flowLst = FlowList(sketch, **timeouts)
+        buf = None
+        if (plain):
+            with open(path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        while True:
+            batch = inbox.get()
+            if (batch is None):
+                break
+            data, starts, caplens, times, linktypes, indices = batch
+            if (plain):
+                data = buf
+            frames = zip(starts.tolist(), caplens.tolist(), times.tolist())
+            records = decoder.decode_frames(data, frames, linktypes.tolist(), indices.tolist())
+            flowLst.populate(records)
+        if (buf is not None):
+            buf.close()
+
+        # the flows travel as columns; the FlowList keeps only the aggregates
+        columns = cache.flow_columns(sorted(flowLst.flows.values(), key=lambda flow: flow.firstIndex))
+        flowLst.flows = {}
+        flowLst.uniqueFlows = {"TCP": [], "UDP": []}
+        flowLst.invalidFlows = {"TCP": {}, "UDP": {}}
+        flowLst._timeouts = []
+        outbox.put((index, flowLst, columns))
+    except BaseException as error:
+        outbox.put((index, error))
+
+# Resolve the UNKNOWN shards of a batch by decoding those packets;
+# decode(i) returns the PacketRecord of packet i
+def _resolveUnknown(shards, count, decode):
+    for i in np.flatnonzero(shards == decoder.UNKNOWN).tolist():
+        shards[i] = decoder.record_shard(decode(i), count)
+    return shards
+
+# Yield the batches of every shard for the packets of a plain pcap file
+def _splitPcap(path, count):
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(buf)
+    data = np.frombuffer(buf, dtype=np.uint8)
+    try:
+        header = decoder._read_pcap_header(view)
+        records = decoder._pcap_records(view, decoder._PCAP_HEADER_LEN, header)
+        index = 0
+        while True:
+            batch = list(itertools.islice(records, SPLIT_SIZE))
+            if (len(batch) == 0):
+                return
+            starts, caplens, times = zip(*batch)
+            linktypes = np.full(len(starts), header[2])
+            shards = decoder.frame_shards(data, starts, caplens, linktypes, count)
+            shards = _resolveUnknown(shards, count, lambda i: decoder._decode_frame(view, starts[i], caplens[i],
+                                                                                    times[i], header[2]))
+            columns = (np.array(starts, dtype=np.int64), np.array(caplens, dtype=np.int64),
+                       np.array(times, dtype=np.int64), linktypes, np.arange(index, index + len(starts)))
+            index += len(starts)
+            # the workers read the frames from their own mmap of the file
+            yield [(None,) + tuple(column[shards == s] for column in columns) for s in range(count)]
+    finally:
+        del data
+        view.release()
+        buf.close()
+
+# Yield the batches of every shard for the raw frames of any other trace
+def _splitFrames(path, count):
+    for frames in ingest._batched(ingest.read_frames(path), SPLIT_SIZE):
+        datas = [frame.data for frame in frames]
+        caplens = np.fromiter(map(len, datas), dtype=np.int64, count=len(datas))
+        linktypes = np.array([frame.linktype for frame in frames], dtype=np.int64)
+        shards = decoder.frame_shards(np.frombuffer(b''.join(datas), dtype=np.uint8),
+                                      np.cumsum(caplens) - caplens, caplens, linktypes, count)
+        shards = _resolveUnknown(shards, count, lambda i: decoder.decode_frame(frames[i]))
+        times = np.array([frame.time_ns for frame in frames], dtype=np.int64)
+        indices = np.array([frame.index for frame in frames], dtype=np.int64)
+        batches = []
+        for s in range(count):
+            selected = np.flatnonzero(shards == s)
+            # frames packed back to back
+            batches.append((b''.join([datas[i] for i in selected.tolist()]),
+                            np.cumsum(caplens[selected]) - caplens[selected], caplens[selected],
+                            times[selected], linktypes[selected], indices[selected]))
+        yield batches
+
+# Store the results waiting in outbox; raise the error of a failed worker
+def _receive(outbox, results, timeout=None):
+    try:
+        result = outbox.get(timeout=timeout) if (timeout) else outbox.get_nowait()
+        while True:
+            if (len(result) == 2):
+                raise result[1]
+            results[result[0]] = result[1:]
+            result = outbox.get_nowait()
+    except queue.Empty:
+        pass
+
+def _checkAlive(processes, outbox, results):
+    for index, worker in enumerate(processes):
+        if (results[index] is None and not worker.is_alive()):
+            # a finished worker flushed its result before exiting
+            _receive(outbox, results)
+            if (results[index] is None):
+                raise RuntimeError("Shard worker " + worker.name + " exited unexpectedly")
+
+def _send(inbox, batch, processes, outbox, results):
+    while True:
+        try:
+            inbox.put(batch, timeout=_POLL)
+            return
+        except queue.Full:
+            _checkAlive(processes, outbox, results)
+
+def populateSharded(path, workers, sketch=False, timeouts=None):
+    if (timeouts is None):
+        timeouts = {}
+    print("> Populating flow list with " + str(workers) + " workers")
+    plain = _plainPcap(path)
+    outbox = multiprocessing.Queue()
+    inboxes = []
+    processes = []
+    try:
+        for index in range(workers):
+            inbox = multiprocessing.Queue(QUEUE_DEPTH)
+            worker = multiprocessing.Process(target=_populateShard, name="shard " + str(index), daemon=True,
+                                             args=(path, plain, index, inbox, outbox, sketch, timeouts))
+            worker.start()
+            inboxes.append(inbox)
+            processes.append(worker)
+
+        results = [None] * workers
+        split = _splitPcap(path, workers) if (plain) else _splitFrames(path, workers)
+        for batches in split:
+            for index, batch in enumerate(batches):
+                if (len(batch[-1]) > 0):
+                    _send(inboxes[index], batch, processes, outbox, results)
+        for inbox in inboxes:
+            _send(inbox, None, processes, outbox, results)
+
+        while (None in results):
+            _receive(outbox, results, _POLL)
+            _checkAlive(processes, outbox, results)
+        for worker in processes:
+            worker.join()
+    finally:
+        for worker in processes:
+            if (worker.is_alive()):
+                worker.terminate()
+
+    shards = []
+    for shardLst, columns in results:
+        cache.add_flow_columns(shardLst, columns)
+        shards.append(shardLst)
+    flowLst = FlowList(sketch, **timeouts)
+    flowLst.merge(shards)
+    return flowLst
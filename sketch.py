@@ -0,0 +1,220 @@
+import math
+from array import array
+
+import numpy as np
+
+class LogHistogram:
+    """
+    Constant-memory sketch of a distribution of non-negative values, used to
+    draw CDFs without keeping every value.
+
+    Values are counted in logarithmic buckets (gamma^(i-1), gamma^i], with
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy); zeros are
+    counted exactly. Every value is reported as its bucket's representative
+    2 * gamma^i / (gamma + 1), which is within relative_accuracy of the value.
+    So any quantile or CDF point read from the sketch has the exact rank and
+    is off by at most relative_accuracy * value along the x axis. With the
+    default 1% accuracy, values from 1e-6 to 1e9 need at most ~1750 buckets,
+    however many values are added.
+
+    Instance variables
+    self.relative_accuracy: float
+        bound on the relative error of reported values
+    self.count: int
+        number of values added
+    self.total: float
+        exact sum of the values added
+    self.zero_count: int
+        number of values that were <= 0
+    self.buckets: dict(int:int)
+        bucket index -> number of values in that bucket
+    """
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.total = 0
+        self.zero_count = 0
+        self.buckets = {}
+
+    # Bucket index of each positive value (a number or numpy array). Every
+    # path that adds or removes values goes through here, so a value always
+    # lands in the same bucket
+    def _index(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def append(self, value):
+        self.count += 1
+        self.total += value
+        if value <= 0:
+            self.zero_count += 1
+            return
+        i = int(self._index(value))
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+
+    def extend(self, values):
+        if isinstance(values, LogHistogram):
+            self.merge(values)
+            return
+        values = np.asarray(values, dtype=np.float64)
+        self._add_counts(values, 1)
+
+    def remove(self, values):
+        """
+        Remove values that were previously added; they fall in the same
+        buckets, so the result is the same as never adding them.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self._add_counts(values, -1)
+
+    def _add_counts(self, values, sign):
+        self.count += sign * len(values)
+        self.total += sign * float(values.sum())
+        positive = values[values > 0]
+        self.zero_count += sign * (len(values) - len(positive))
+        index, counts = np.unique(self._index(positive), return_counts=True)
+        for i, c in zip(index.tolist(), counts.tolist()):
+            c = self.buckets.get(i, 0) + sign * c
+            if c:
+                self.buckets[i] = c
+            else:
+                del self.buckets[i]
+
+    def flush(self):
+        # values are counted as they are added
+        pass
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.zero_count += other.zero_count
+        for i, c in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + c
+
+    def copy(self):
+        sketch = LogHistogram(self.relative_accuracy)
+        sketch.merge(self)
+        return sketch
+
+    def __len__(self):
+        return self.count
+
+    def cdf(self):
+        """
+        Return (x, y) numpy arrays: y[k] is the fraction of values whose
+        bucket is at or below x[k].
+        """
+        index = np.array(sorted(self.buckets), dtype=np.float64)
+        counts = np.array([self.buckets[i] for i in sorted(self.buckets)], dtype=np.float64)
+        x = 2 * self.gamma ** index / (self.gamma + 1)
+        if self.zero_count:
+            x = np.concatenate(([0.0], x))
+            counts = np.concatenate(([self.zero_count], counts))
+        return x, np.cumsum(counts) / max(self.count, 1)
+
+    def quantile(self, q):
+        x, y = self.cdf()
+        if len(x) == 0:
+            return None
+        return x[min(np.searchsorted(y, q), len(x) - 1)]
+
+class IntHistogram:
+    """
+    Exact distribution of small non-negative integers (e.g. packet sizes,
+    which are bounded by the MTU), stored as one count per value instead of
+    one entry per occurrence.
+
+    append is the C-level append of a typed buffer, so adding a value costs
+    no more than appending to a list; flush folds the buffer into the counts
+    and is called by every method that reads them. Callers that add many
+    values should flush now and then to keep the buffer small.
+
+    Instance variables
+    self.total: int
+        sum of the flushed values
+    self.counts: numpy array(int)
+        counts[v] is the number of times v was added
+    """
+    def __init__(self):
+        self.total = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._pending = array('I')
+        self.append = self._pending.append
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        values = np.frombuffer(self._pending, dtype=np.uint32)
+        added = np.bincount(values)
+        self.total += int(values.sum(dtype=np.int64))
+        del values
+        del self._pending[:]
+        self._add(added)
+
+    def _add(self, added):
+        if len(added) > len(self.counts):
+            self.counts = np.concatenate((self.counts, np.zeros(len(added) - len(self.counts), dtype=np.int64)))
+        self.counts[:len(added)] += added
+
+    def extend(self, values):
+        if isinstance(values, IntHistogram):
+            self.merge(values)
+            return
+        if isinstance(values, np.ndarray):
+            self.total += int(values.sum(dtype=np.int64))
+            self._add(np.bincount(values))
+            return
+        self._pending.extend(values)
+
+    def merge(self, other):
+        self.flush()
+        other.flush()
+        self.total += other.total
+        self._add(other.counts)
+
+    def copy(self):
+        histogram = IntHistogram()
+        histogram.merge(self)
+        return histogram
+
+    def __len__(self):
+        return int(self.counts.sum()) + len(self._pending)
+
+    def cdf(self):
+        """
+        Return (x, y) numpy arrays tracing the same curve as the sorted values:
+        each distinct value v gets a point at the fraction of values below v
+        plus one, and a point at the fraction of values <= v.
+        """
+        self.flush()
+        x = np.flatnonzero(self.counts)
+        counts = self.counts[x]
+        cumulative = np.cumsum(counts)
+        n = max(cumulative[-1] if len(x) else 0, 1)
+        y = np.empty(2 * len(x))
+        y[0::2] = (cumulative - counts + 1) / n
+        y[1::2] = cumulative / n
+        return np.repeat(x, 2), y
+
+# ======================== CDF Helpers ========================
+
+# Return the (x, y) points of the CDF of data, a histogram or a sequence of values
+def cdf_points(data):
+    if isinstance(data, (LogHistogram, IntHistogram)):
+        return data.cdf()
+    x = np.sort(data)
+    y = np.arange(1, len(x) + 1) / len(x)
+    return x, y
+
+# Combine several sets of values into one: histograms are merged into a new
+# histogram, sequences are concatenated
+def combine(parts):
+    if len(parts) == 0:
+        return np.zeros(0)
+    if isinstance(parts[0], (LogHistogram, IntHistogram)):
+        combined = parts[0].copy()
+        for part in parts[1:]:
+            combined.merge(part)
+        return combined
+    return np.concatenate([np.asarray(part, dtype=np.float64) for part in parts])
@@ -0,0 +1,136 @@
+import heapq
+import random
+import socket
+import struct
+import sys
+
+# ======================== Synthetic Trace Generator ========================
+# Writes a deterministic classic pcap of TCP and UDP flows, so the analysis can
+# be benchmarked without the real traces. Frames are Ethernet + 802.1Q like
+# trace1, carrying IPv4 or IPv6. TCP flows open with a handshake, then
+# alternate data and replies whose seq/ack numbers pair up for RTT estimation,
+# and close with FIN/ACK, a RST or not at all.
+
+_PCAP_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+_RECORD = struct.Struct('<IIII')
+_ETHER_VLAN = struct.Struct('!6s6sHHH')
+_IPV4 = struct.Struct('!BBHHHBBH4s4s')
+_IPV6 = struct.Struct('!IHBB16s16s')
+_TCP = struct.Struct('!HHIIBBHHH')
+_UDP = struct.Struct('!HHHH')
+
+_MACS = (b'\x00\x16\x3e\x00\x00\x01', b'\x00\x16\x3e\x00\x00\x02')
+
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+PSH = 0x08
+ACK = 0x10
+
+DEFAULTS = {'flows': 1000, 'packets': 100000, 'tcp_ratio': 0.8, 'ipv6_ratio': 0.1,
+            'fin_ratio': 0.5, 'rst_ratio': 0.2, 'duration': 600.0, 'snaplen': 96, 'seed': 1}
+
+def _frame(src, dst, ipv6, proto, transport, payload_len, snaplen):
+    if ipv6:
+        ip = _IPV6.pack(0x60000000, len(transport) + payload_len, proto, 64, src, dst)
+        ethertype = 0x86dd
+    else:
+        ip = _IPV4.pack(0x45, 0, 20 + len(transport) + payload_len, 0, 0x4000, 64, proto, 0, src, dst)
+        ethertype = 0x0800
+    header = _ETHER_VLAN.pack(_MACS[0], _MACS[1], 0x8100, 1, ethertype) + ip + transport
+    length = len(header) + payload_len
+    caplen = min(length, snaplen)
+    return (header + bytes(max(0, caplen - len(header))))[:caplen], length
+
+def _address(rng, ipv6, host):
+    if ipv6:
+        return socket.inet_pton(socket.AF_INET6, '2001:db8::%x:%x' % (host, rng.randrange(1, 0xffff)))
+    return socket.inet_aton('10.%d.%d.%d' % (host % 250, rng.randrange(256), rng.randrange(1, 255)))
+
+# Yield (time, frame, length) for every packet of one flow, in time order
+def _flow_packets(rng, index, packets, tcp, ipv6, close, start, snaplen):
+    client = _address(rng, ipv6, index)
+    server = _address(rng, ipv6, rng.randrange(64))
+    cport = rng.randrange(1024, 65536)
+    sport = rng.choice((80, 443, 22, 53, 8080))
+    rtt = rng.uniform(0.001, 0.2)
+    time = start
+    if not tcp:
+        for i in range(packets):
+            src, dst, a, b = (client, server, cport, sport) if i % 2 == 0 else (server, client, sport, cport)
+            size = rng.randrange(0, 1200)
+            frame, length = _frame(src, dst, ipv6, 17, _UDP.pack(a, b, 8 + size, 0), size, snaplen)
+            yield time, frame, length
+            time += rng.expovariate(1 / rtt)
+        return
+
+    seqs = [rng.randrange(1 << 32), rng.randrange(1 << 32)]
+    # handshake, then data from the client answered by the server
+    pattern = [(0, SYN, 0), (1, SYN | ACK, 0), (0, ACK, 0)]
+    data = max(0, packets - len(pattern) - (3 if close == 'fin' else 1 if close == 'rst' else 0))
+    for i in range(data):
+        side = i % 2
+        pattern.append((side, PSH | ACK, rng.randrange(1, 1400) if side == 0 else rng.randrange(0, 1400)))
+    if close == 'fin':
+        pattern += [(0, FIN | ACK, 0), (1, FIN | ACK, 0), (0, ACK, 0)]
+    elif close == 'rst':
+        pattern.append((rng.randrange(2), RST, 0))
+
+    for side, flags, size in pattern[:max(packets, 1)]:
+        src, dst, a, b = (client, server, cport, sport) if side == 0 else (server, client, sport, cport)
+        transport = _TCP.pack(a, b, seqs[side], seqs[1 - side] if flags & ACK else 0,
+                              5 << 4, flags, 65535, 0, 0)
+        frame, length = _frame(src, dst, ipv6, 6, transport, size, snaplen)
+        yield time, frame, length
+        seqs[side] = (seqs[side] + size + (1 if flags & (SYN | FIN) else 0)) & 0xffffffff
+        # the reply to a packet comes one RTT later; the next request after a think time
+        time += rtt if side == 0 else rng.expovariate(1 / (4 * rtt))
+
+def _flow_sizes(rng, flows, packets):
+    # heavy-tailed flow sizes scaled to the requested packet count
+    weights = [rng.paretovariate(1.2) for _ in range(flows)]
+    scale = packets / sum(weights)
+    sizes = [max(1, int(w * scale)) for w in weights]
+    sizes[0] += max(0, packets - sum(sizes))
+    return sizes
+
+# Write a synthetic trace to path; options are those of DEFAULTS.
+# Returns the number of packets written.
+def write_trace(path, **options):
+    opts = dict(DEFAULTS)
+    opts.update(options)
+    rng = random.Random(opts['seed'])
+
+    flows = []
+    for index, packets in enumerate(_flow_sizes(rng, opts['flows'], opts['packets'])):
+        tcp = rng.random() < opts['tcp_ratio']
+        ipv6 = rng.random() < opts['ipv6_ratio']
+        roll = rng.random()
+        close = 'fin' if roll < opts['fin_ratio'] else 'rst' if roll < opts['fin_ratio'] + opts['rst_ratio'] else None
+        start = 1500000000 + rng.uniform(0, opts['duration'])
+        flow_rng = random.Random(rng.random())
+        flows.append(_flow_packets(flow_rng, index, packets, tcp, ipv6, close, start, opts['snaplen']))
+
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(_PCAP_HEADER)
+        for time, frame, length in heapq.merge(*flows, key=lambda packet: packet[0]):
+            usec = int(round(time * 1000000))
+            f.write(_RECORD.pack(usec // 1000000, usec % 1000000, len(frame), length))
+            f.write(frame)
+            count += 1
+    return count
+
+def parse_options(argv):
+    options = {}
+    for name, default in DEFAULTS.items():
+        flag = '--' + name.replace('_', '-')
+        if flag in argv:
+            options[name] = type(default)(argv[argv.index(flag) + 1])
+    return options
+
+if __name__ == '__main__':
+    # python synth.py OUT.pcap [--flows N] [--packets N] [--tcp-ratio R] [--ipv6-ratio R]
+    #   [--fin-ratio R] [--rst-ratio R] [--duration S] [--snaplen N] [--seed N]
+    count = write_trace(sys.argv[1], **parse_options(sys.argv))
+    print("> Wrote " + str(count) + " packets to '" + sys.argv[1] + "'")
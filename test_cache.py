@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import cache
+import decoder
+import trace_parser as parser
+from flow import FlowList
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+def flow_fields(flow):
+    return (flow.type, flow.nodes, flow.firstIndex, flow.state, flow.valid, flow.firstArrival, flow.lastArrival,
+            list(flow.times), list(flow.sizes), list(flow.rtt.samples) if flow.rtt else None)
+
+def test_same_name_in_two_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    paths = []
+    for name in ('a', 'b'):
+        os.mkdir(str(tmp_path / name))
+        paths.append(str(tmp_path / name / 'trace.pcap'))
+    shutil.copy(TRACE, paths[0])
+    # the second trace holds about the first half of the packets
+    with open(TRACE, 'rb') as f:
+        data = f.read()
+    with open(paths[1], 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    flow_lists = []
+    for path in paths:
+        flow_list = FlowList()
+        flow_list.populate(decoder.read_records(path))
+        cache.save_flows(path, flow_list)
+        flow_lists.append(flow_list)
+    assert flow_lists[1].totalPackets != flow_lists[0].totalPackets
+
+    # both entries are kept
+    for path, expected in zip(paths, flow_lists):
+        loaded = cache.load_flows(path)
+        assert loaded is not None
+        assert loaded.totalPackets == expected.totalPackets
+        for typ in expected.uniqueFlows:
+            assert (list(map(flow_fields, loaded.uniqueFlows[typ])) ==
+                    list(map(flow_fields, expected.uniqueFlows[typ])))
@@ -0,0 +1,51 @@
+import os
+
+from scapy.all import ARP, Dot1Q, Ether, IP, IPv6, IPv6ExtHdrHopByHop, Raw, TCP, UDP, rdpcap, wrpcap
+
+import decoder
+import trace_parser as parser
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+FIELDS = ('time', 'time_ns', 'length', 'size', 'layers', 'proto', 'type', 'src', 'dst', 'sport',
+          'dport', 'flags', 'seq', 'ack', 'header_size', 'payload_len')
+
+# Compare every record of the fast decoder with the scapy path for the same packet
+def assert_parity(path):
+    packets = rdpcap(path)
+    records = list(decoder.read_records(path))
+    assert len(records) == len(packets)
+    for index, (record, packet) in enumerate(zip(records, packets)):
+        expected = decoder.from_packet(packet)
+        assert record.index == index
+        for field in FIELDS:
+            assert getattr(record, field) == getattr(expected, field), (index, field)
+    return packets, records
+
+def test_trace1_matches_scapy():
+    packets, records = assert_parity(TRACE)
+    # the trace covers snaplen-truncated frames and frames without IP
+    assert any(len(packet) < packet.wirelen for packet in packets)
+    assert any(record.type is None and not ('IPv4' in dict(record.layers)) for record in records)
+    assert any(dict(record.layers).get('ARP') for record in records)
+
+def test_edge_frames_match_scapy(tmp_path):
+    frames = [Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2') / TCP(sport=40000, dport=80, flags='PA') / Raw(b'x' * 10),
+              # TCP port that scapy dissects further (SMB)
+              Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2') / TCP(sport=40000, dport=445) / Raw(b'y' * 20),
+              Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2') / IPv6ExtHdrHopByHop() / TCP(sport=1, dport=2) / Raw(b'z'),
+              Ether() / IPv6(src='2001:db8::1', dst='2001:db8::2') / UDP(sport=5000, dport=5001) / Raw(b'u' * 7),
+              Ether() / Dot1Q(vlan=1) / Dot1Q(vlan=2) / IP(src='10.0.0.1', dst='10.0.0.2') / TCP(flags='S'),
+              # non-first fragment
+              Ether() / IP(src='10.0.0.1', dst='10.0.0.2', frag=10, proto=6) / Raw(b'f' * 16),
+              Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=53, dport=5353) / Raw(b'd' * 5),
+              Ether() / ARP()]
+    for i, frame in enumerate(frames):
+        frame.time = 1000 + i * 0.25
+    path = str(tmp_path / 'edge.pcap')
+    wrpcap(path, frames)
+    assert_parity(path)
+
+    # cut the TCP header of one frame short: it is still decoded like scapy does
+    wrpcap(path, [Ether(bytes(frames[0])[:14 + 40 + 10])])
+    assert_parity(path)
@@ -0,0 +1,129 @@
+import os
+from collections import defaultdict
+
+from scapy.all import rdpcap
+
+import decoder
+import trace_parser as parser
+from flow import ACK, FIN, SYN, FLOW_METRICS, FlowList, flowKey
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+# Durations and inter-arrival times are the exact differences of the capture
+# timestamps, as scapy reads them (decimal seconds), rounded once to float ms
+def test_trace1_times_are_exact():
+    packets = rdpcap(TRACE)
+    flow_times = defaultdict(list)
+    for packet, record in zip(packets, decoder.read_records(TRACE)):
+        if record.type is not None:
+            key = flowKey(record.type, (record.src, record.sport), (record.dst, record.dport))
+            flow_times[key].append(packet.time)
+
+    flow_list = FlowList()
+    flow_list.populate(decoder.read_records(TRACE))
+    assert len(flow_list.flows) == len(flow_times)
+    for key, flow in flow_list.flows.items():
+        times = flow_times[key]
+        assert flow.getDuration() == float((times[-1] - times[0]) * 1000)
+        assert flow.getInterArrivalTimes() == [0] + [float((times[i] - times[i - 1]) * 1000)
+                                                     for i in range(1, len(times))]
+        assert flow.firstArrival == float(times[0])
+        assert flow.lastArrival == float(times[-1])
+
+# ==================== Flow Eviction ====================
+
+def packet(time, sport, dport=53, typ='UDP', flags=0, index=-1):
+    if sport < dport:
+        src, dst = '10.0.0.1', '10.0.0.2'
+    else:
+        src, dst = '10.0.0.2', '10.0.0.1'
+    return decoder.PacketRecord(round(time * 1000000000), 60, 60, (), 6 if typ == 'TCP' else 17, typ,
+                                src, dst, sport, dport, flags, header_size=42, index=index)
+
+def flow_times(flow_list, sport):
+    flows = flow_list.uniqueFlows['UDP'] + flow_list.uniqueFlows['TCP']
+    return [[t / 1e9 for t in flow.times] for flow in flows if flow.nodes[0][1] == sport]
+
+def test_idle_timeout():
+    flow_list = FlowList(idleTimeout=5.0)
+    flow_list.populate([packet(0, 1000), packet(1, 1000), packet(5.9, 2000)])
+    assert flow_times(flow_list, 1000) == [[0, 1]]
+    flow_list.populate([packet(6, 2000)])
+    assert flow_times(flow_list, 1000) == []
+    assert not (flowKey('UDP', ('10.0.0.1', 1000), ('10.0.0.2', 53)) in flow_list.flows)
+    # a later packet starts a new flow
+    flow_list.populate([packet(7, 1000)])
+    assert flow_times(flow_list, 1000) == [[7]]
+    assert flow_list.count['UDP'] == 3
+    assert flow_list.totalPackets['UDP'] == 5
+    assert flow_list.evictedMetrics['UDP']['packets'].count == 1
+
+def test_active_timeout():
+    flow_list = FlowList(activeTimeout=10.0)
+    flow_list.populate([packet(t, 1000) for t in range(15)])
+    assert flow_times(flow_list, 1000) == [list(range(10, 15))]
+    assert flow_list.count['UDP'] == 2
+    assert flow_list.evictedMetrics['UDP']['packets'].total == 10
+    assert flow_list.evictedMetrics['UDP']['duration'].count == 1
+
+def test_finish_timeout():
+    handshake = [packet(0, 1000, 80, 'TCP', SYN), packet(0.1, 80, 1000, 'TCP', SYN | ACK),
+                 packet(0.2, 1000, 80, 'TCP', ACK), packet(0.5, 1000, 80, 'TCP', FIN | ACK),
+                 packet(0.6, 80, 1000, 'TCP', FIN | ACK)]
+    flow_list = FlowList(finishTimeout=2.0)
+    flow_list.populate(handshake + [packet(0.7, 2000), packet(2.5, 2000)])
+    assert flow_list.uniqueFlows['TCP'][0].state == 'Finished'
+    assert len(flow_list.uniqueFlows['TCP']) == 1
+    flow_list.populate([packet(2.6, 2000)])
+    assert flow_list.uniqueFlows['TCP'] == []
+    assert flow_list.states['Finished'] == 1
+    # flows that are not finished stay
+    assert flow_times(flow_list, 2000) == [[0.7, 2.5, 2.6]]
+
+def test_evicted_invalid_flows_leave_the_sketches():
+    flow_list = FlowList(idleTimeout=10000.0)
+    # a gap of more than 90 minutes makes a flow invalid
+    flow_list.populate([packet(0, 1000), packet(6000, 1000), packet(6001, 2000), packet(6002, 2000)])
+    assert len(flow_list.invalidFlows['UDP']) == 1
+    assert flow_list.interArrivals['UDP'].count == 4
+    flow_list.populate([packet(16001, 3000)])
+    assert flow_list.invalidFlows['UDP'] == {}
+    assert flow_list.evictedMetrics['UDP']['packets'].count == 0
+
+    expected = FlowList(idleTimeout=10000.0)
+    expected.populate([packet(6001, 2000), packet(6002, 2000), packet(16001, 3000)])
+    sketch = flow_list.interArrivals['UDP']
+    assert (sketch.count, sketch.zero_count, sketch.buckets) == (3, 2, expected.interArrivals['UDP'].buckets)
+    assert flow_list.getFlowMetric('UDP', 'interarrival').count == 3
+
+def flow_fields(flow):
+    return (flow.type, flow.nodes, flow.firstIndex, flow.state, flow.valid, list(flow.times), list(flow.sizes))
+
+def sketch_fields(sketch):
+    return sketch.count, sketch.zero_count, sketch.buckets
+
+def test_merge_evicting_shards():
+    records = list(decoder.read_records(TRACE))
+    for timeouts in ({'idleTimeout': 0.001}, {'activeTimeout': 0.003}, {'finishTimeout': 0.0005},
+                     {'idleTimeout': 0.002, 'activeTimeout': 0.004, 'finishTimeout': 0.0005}):
+        expected = FlowList(**timeouts)
+        expected.populate(records)
+        assert sum(expected.evictedMetrics[typ]['packets'].count for typ in expected.count) > 0
+
+        shards = [FlowList(**timeouts) for _ in range(3)]
+        for shard, count in zip(shards, range(3)):
+            shard.populate(record for record in records if decoder.record_shard(record, 3) == count)
+        flow_list = FlowList(**timeouts)
+        flow_list.merge(shards)
+
+        assert flow_list.count == expected.count
+        assert flow_list.totalPackets == expected.totalPackets
+        assert flow_list.states == expected.states
+        assert sorted(flow_list.flows) == sorted(expected.flows)
+        for typ in flow_list.count:
+            assert (list(map(flow_fields, flow_list.uniqueFlows[typ])) ==
+                    list(map(flow_fields, expected.uniqueFlows[typ])))
+            assert sketch_fields(flow_list.interArrivals[typ]) == sketch_fields(expected.interArrivals[typ])
+            for metric in FLOW_METRICS:
+                assert (sketch_fields(flow_list.evictedMetrics[typ][metric]) ==
+                        sketch_fields(expected.evictedMetrics[typ][metric]))
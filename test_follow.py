@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import time
+
+import perFlow
+import trace_parser as parser
+from flow import FlowList
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+# Seconds between appends to the growing capture
+STEP = 0.5
+
+def _append(path, parts):
+    for part in parts:
+        time.sleep(STEP)
+        with open(path, 'ab') as f:
+            f.write(part)
+
+def test_follow_growing_capture(tmp_path, monkeypatch):
+    with open(TRACE, 'rb') as f:
+        data = f.read()
+    # cut at arbitrary offsets, so records arrive split across appends
+    cuts = [0, 10, len(data) // 4 + 3, len(data) // 2 - 7, 3 * len(data) // 4 + 5, len(data)]
+    parts = [data[cuts[i]:cuts[i + 1]] for i in range(len(cuts) - 1)]
+    path = str(tmp_path / 'growing.pcap')
+    open(path, 'wb').close()
+    fName = str(tmp_path / 'follow')
+
+    # flow counts of every report written while following
+    written = []
+    writeMarkdown = perFlow.writeMarkdown
+    def record(name, flowLst):
+        writeMarkdown(name, flowLst)
+        written.append(sum(flowLst.count.values()))
+    monkeypatch.setattr(perFlow, 'writeMarkdown', record)
+
+    # the capture grows from another process, as with tcpdump -w
+    writer = multiprocessing.Process(target=_append, args=(path, parts))
+    writer.start()
+    start = time.monotonic()
+    flowLst = perFlow.followFlowList(path, fName, interval=0.2, idleTimeout=2 * STEP + 0.5)
+    elapsed = time.monotonic() - start
+    writer.join()
+    assert writer.exitcode == 0
+
+    # stopped on its own once the capture went idle
+    assert elapsed < len(parts) * STEP + 5
+    expected = FlowList()
+    expected.populate(parser._parse_tracefile(TRACE, decode=True))
+    assert flowLst.count == expected.count
+    assert flowLst.states == expected.states
+    assert flowLst.totalPackets == expected.totalPackets
+
+    # the report was rewritten as the capture grew, not only at the end
+    assert written == sorted(written)
+    assert len(set(written)) >= 3
+    assert written[-1] == sum(expected.count.values())
+    with open(fName + '.md') as f:
+        followed = f.read()
+    writeMarkdown(str(tmp_path / 'expected'), expected)
+    with open(str(tmp_path / 'expected.md')) as f:
+        assert followed == f.read()
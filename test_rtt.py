@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+
+import decoder
+import rtt
+import trace_parser as parser
+from flow import FlowList
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+SYN = 0x02
+ACK = 0x10
+
+# RTT samples of the packets (direction, time, flags, seq, ack, length) of one
+# flow, matched by scanning every segment sent so far; sequence numbers must
+# not wrap around
+def naive_samples(packets):
+    # per direction: [start, end, send time, sent more than once, acknowledged]
+    sent = ([], [])
+    samples = []
+    for direction, time, flags, seq, ack, length in packets:
+        if flags & ACK:
+            covered = [segment for segment in sent[1 - direction] if not segment[4] and segment[1] <= ack]
+            for segment in covered:
+                segment[4] = True
+            if covered and covered[-1][1] == ack and not covered[-1][3]:
+                samples.append((time - covered[-1][2]) / 1000000000)
+        length += (flags & 0x01) + ((flags & SYN) >> 1)
+        if length == 0:
+            continue
+        end = seq + length
+        ends = [segment[1] for segment in sent[direction]]
+        if not ends or seq >= max(ends):
+            sent[direction].append([seq, end, time, False, False])
+            continue
+        for segment in sent[direction]:
+            if not segment[4] and segment[0] < end and segment[1] > seq:
+                segment[3] = True
+        if end > max(ends):
+            sent[direction].append([max(ends), end, time, True, False])
+    return samples
+
+def tracker_samples(packets):
+    tracker = rtt.RttTracker()
+    for direction, time, flags, seq, ack, length in packets:
+        tracker.add(direction, time, flags, seq & 0xFFFFFFFF, ack & 0xFFFFFFFF, length)
+    return list(tracker.samples)
+
+# The (direction, time, flags, seq, ack, length) of the packets of every TCP
+# flow of trace1
+def trace_flows():
+    flows = {}
+    for record in decoder.read_records(TRACE):
+        if record.type == 'TCP':
+            a = (record.src, record.sport)
+            b = (record.dst, record.dport)
+            key = (a, b) if a <= b else (b, a)
+            flows.setdefault(key, []).append((0 if a == key[0] else 1, record.time_ns, record.flags,
+                                              record.seq, record.ack, record.payload_len))
+    return list(flows.values())
+
+def test_trace1_matches_naive():
+    flows = trace_flows()
+    assert sum(len(naive_samples(packets)) for packets in flows) > 0
+    for packets in flows:
+        assert tracker_samples(packets) == naive_samples(packets)
+
+    # the trackers of a FlowList took the same samples
+    flow_list = FlowList()
+    flow_list.populate(decoder.read_records(TRACE))
+    samples = sorted(sample for flow in flow_list.uniqueFlows['TCP'] for sample in flow.rtt.samples)
+    assert samples == sorted(sample for packets in flows for sample in naive_samples(packets))
+
+def test_trace1_wraparound():
+    # the same flows with their sequence numbers shifted to wrap around early on
+    for packets in trace_flows():
+        first = [None, None]
+        for direction, _, _, seq, _, _ in packets:
+            if first[direction] is None:
+                first[direction] = seq
+        shift = [(1 << 32) - (start or 0) - 500 for start in first]
+        shifted = [(direction, time, flags, seq + shift[direction], ack + shift[1 - direction], length)
+                   for direction, time, flags, seq, ack, length in packets]
+        assert tracker_samples(shifted) == naive_samples(packets)
+
+def test_wraparound():
+    start = (1 << 32) - 150
+    packets = []
+    for i in range(6):
+        packets.append((0, i * 2000, ACK, start + i * 100, 1, 100))
+        packets.append((1, i * 2000 + 1000 + i, ACK, 1, start + (i + 1) * 100, 0))
+    assert tracker_samples(packets) == [(1000 + i) / 1000000000 for i in range(6)]
+
+def test_retransmission():
+    packets = [(0, 0, SYN, 0, 0, 0),
+               (1, 10, SYN | ACK, 5000, 1, 0),
+               (0, 20, ACK, 1, 5001, 100),
+               (0, 30, ACK, 101, 5001, 100),
+               # the first segment again: its ACK gives no sample
+               (0, 40, ACK, 1, 5001, 100),
+               (1, 50, ACK, 5001, 101, 0),
+               (1, 60, ACK, 5001, 201, 0),
+               # a retransmission that also carries new data gives no sample either
+               (0, 70, ACK, 201, 5001, 100),
+               (0, 80, ACK, 251, 5001, 100),
+               (1, 90, ACK, 5001, 351, 0)]
+    assert tracker_samples(packets) == naive_samples(packets) == [10 / 1e9, 10 / 1e9, 30 / 1e9]
+
+def test_cumulative_and_partial_acks():
+    packets = [(0, 0, ACK, 0, 0, 100),
+               (0, 10, ACK, 100, 0, 100),
+               (0, 20, ACK, 200, 0, 100),
+               (0, 30, ACK, 300, 0, 100),
+               # covers two segments and gives one sample, of the last
+               (1, 100, ACK, 0, 200, 0),
+               # ends inside a segment
+               (1, 110, ACK, 0, 250, 0),
+               (1, 120, ACK, 0, 300, 0),
+               # an old ACK
+               (1, 130, ACK, 0, 250, 0),
+               (1, 140, ACK, 0, 400, 0)]
+    assert tracker_samples(packets) == naive_samples(packets) == [90 / 1e9, 100 / 1e9, 110 / 1e9]
+
+def test_max_outstanding():
+    count = rtt.MAX_OUTSTANDING + 10
+    packets = [(0, i, ACK, i * 10, 0, 10) for i in range(count)]
+    tracker = rtt.RttTracker()
+    for packet in packets:
+        tracker.add(*packet)
+    assert len(tracker._outstanding[0]) == rtt.MAX_OUTSTANDING
+    # the oldest segments were dropped, and their ACK matches nothing
+    assert tracker.add(1, count, ACK, 0, 10, 0) is None
+    assert len(tracker._outstanding[0]) == rtt.MAX_OUTSTANDING
+    assert tracker.add(1, count + 1, ACK, 0, 200, 0) == (count + 1 - 19) / 1e9
+    assert len(tracker._outstanding[0]) == rtt.MAX_OUTSTANDING - 10
+
+def test_smooth_matches_ewma():
+    rng = np.random.default_rng(1)
+    lengths = [1, 5, rtt._BLOCK, rtt._BLOCK + 1, 3 * rtt._BLOCK + 7, 2]
+    values = rng.exponential(20, sum(lengths))
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+
+    expected = []
+    for i, value in enumerate(values):
+        if i == 0 or segments[i] != segments[i - 1]:
+            srtt = value
+        else:
+            srtt = (1 - rtt.ALPHA) * srtt + rtt.ALPHA * value
+        expected.append(srtt)
+    assert np.allclose(rtt._smooth(values, segments), expected, rtol=1e-12, atol=0)
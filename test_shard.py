@@ -0,0 +1,78 @@
+import gzip
+import os
+
+import numpy as np
+from scapy.all import ARP, Dot1Q, Ether, IP, IPv6, IPv6ExtHdrHopByHop, Raw, TCP, UDP, rdpcap, wrpcap
+
+import decoder
+import ingest
+import shard
+import trace_parser as parser
+from flow import FlowList
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+def flow_fields(flow):
+    return (flow.type, flow.nodes, flow.firstIndex, flow.state, flow.valid, flow.totalSize,
+            list(flow.times), list(flow.sizes), list(flow.directions), list(flow.flags or []),
+            list(flow.rtt.samples) if flow.rtt else None)
+
+# The sharded FlowList of path holds the same flows as a single populate
+def assert_sharded(path, workers, timeouts):
+    expected = FlowList(**timeouts)
+    expected.populate(ingest.read_records(path))
+    flow_list = shard.populateSharded(path, workers, timeouts=timeouts)
+    assert flow_list.count == expected.count
+    assert flow_list.totalBytes == expected.totalBytes
+    assert flow_list.states == expected.states
+    for typ in flow_list.uniqueFlows:
+        assert list(map(flow_fields, flow_list.uniqueFlows[typ])) == list(map(flow_fields, expected.uniqueFlows[typ]))
+        assert sorted(map(flow_fields, flow_list.invalidFlows[typ])) == sorted(map(flow_fields, expected.invalidFlows[typ]))
+
+def test_trace1_sharded():
+    for workers in (2, 3):
+        assert_sharded(TRACE, workers, {})
+        assert_sharded(TRACE, workers, {'idleTimeout': 5.0})
+
+def test_frame_shards_match_records(tmp_path):
+    ether = dict(src='00:00:00:00:00:01', dst='00:00:00:00:00:02')
+    frames = []
+    for i in range(40):
+        a = '10.0.%d.1' % (i % 7)
+        b = '2001:db8::%x' % (i % 5 + 1)
+        frames += [Ether(**ether) / IP(src=a, dst='10.1.0.1') / TCP(sport=1000 + i % 3, dport=80),
+                   Ether(**ether) / IP(src='10.1.0.1', dst=a) / TCP(sport=80, dport=1000 + i % 3),
+                   Ether(**ether) / Dot1Q(vlan=1) / Dot1Q(vlan=2) / IP(src=a, dst='10.1.0.2') / UDP(sport=53, dport=5353),
+                   Ether(**ether) / IPv6(src=b, dst='2001:db8::ff') / TCP(sport=40000, dport=443) / Raw(b'x' * i),
+                   # flows only known once decoded
+                   Ether(**ether) / IPv6(src=b, dst='2001:db8::ff') / IPv6ExtHdrHopByHop() / TCP(sport=40000, dport=443),
+                   Ether(**ether) / IP(src=a, dst='10.1.0.3') / IP(src='1.1.1.1', dst='2.2.2.2') / UDP(sport=9, dport=10),
+                   # no flow at all
+                   Ether(**ether) / IP(src=a, dst='10.1.0.1', frag=10, proto=6) / Raw(b'f' * 16),
+                   Ether(**ether) / ARP(hwsrc=ether['src'], psrc=a, pdst='10.1.0.1')]
+    for i, frame in enumerate(frames):
+        frame.time = 1000 + i * 0.1
+    path = str(tmp_path / 'mixed.pcap')
+    wrpcap(path, frames)
+
+    packets = rdpcap(path)
+    data = [bytes(packet) for packet in packets]
+    caplens = np.array([len(d) for d in data])
+    shards = decoder.frame_shards(np.frombuffer(b''.join(data), dtype=np.uint8), np.cumsum(caplens) - caplens,
+                                  caplens, np.full(len(data), decoder.LINKTYPE_ETHERNET), 4)
+    records = list(decoder.read_records(path))
+    assert decoder.UNKNOWN in shards
+    for frame_shard, record in zip(shards.tolist(), records):
+        if frame_shard != decoder.UNKNOWN:
+            assert frame_shard == decoder.record_shard(record, 4)
+
+    assert_sharded(path, 3, {})
+    # compressed segments are split from their raw frames as well
+    segments = tmp_path / 'segments'
+    segments.mkdir()
+    wrpcap(str(segments / 'a.pcap'), packets[:len(packets) // 2])
+    wrpcap(str(tmp_path / 'b.pcap'), packets[len(packets) // 2:])
+    with open(str(tmp_path / 'b.pcap'), 'rb') as f:
+        with gzip.open(str(segments / 'b.pcap.gz'), 'wb') as out:
+            out.write(f.read())
+    assert_sharded(str(segments), 2, {})
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+import decoder
+import trace_parser as parser
+from flow import FlowList
+from sketch import LogHistogram
+
+TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), parser.TEST_TRACE_FILE)
+
+QUANTILES = np.arange(201) / 200
+
+# Every quantile of sketch is within its relative accuracy of the exact one
+def assert_accurate(sketch, values):
+    assert sketch.count == len(values)
+    for q in QUANTILES:
+        exact = np.quantile(values, q, method='inverted_cdf')
+        assert abs(sketch.quantile(q) - exact) <= sketch.relative_accuracy * exact, q
+
+def test_trace1_quantiles():
+    flow_list = FlowList()
+    flow_list.populate(decoder.read_records(TRACE))
+    sketched = FlowList(sketch=True)
+    sketched.populate(decoder.read_records(TRACE))
+    for typ in ('TCP', 'UDP'):
+        values = flow_list.getFlowMetric(typ, 'interarrival')
+        assert np.any(values == 0) and np.any(values > 0)
+        assert_accurate(sketched.getFlowMetric(typ, 'interarrival'), values)
+        for metric in ('duration', 'size'):
+            values = flow_list.getFlowMetric(typ, metric)
+            for accuracy in (0.01, 0.05):
+                appended = LogHistogram(accuracy)
+                for value in values.tolist():
+                    appended.append(value)
+                assert_accurate(appended, values)
+                extended = LogHistogram(accuracy)
+                extended.extend(values)
+                assert extended.buckets == appended.buckets
+                assert_accurate(extended, values)
+
+def test_remove():
+    values = np.random.default_rng(2).lognormal(0, 3, 5000)
+    sketch = LogHistogram()
+    for value in values.tolist():
+        sketch.append(value)
+    sketch.remove(values[1000:])
+    assert_accurate(sketch, values[:1000])
@@ -1,14 +1,42 @@
-from scapy.all import rdpcap
+from scapy.all import rdpcap, PcapReader
+import decoder
+import ingest
 
 TRACE_NUMBER = ((1003142663 + 1003424225) % 20) + 1 # 9
+TRACE_FILE = 'univ1_pt' + str(TRACE_NUMBER)
+TEST_TRACE_FILE = 'trace1'
 
 
-def read_tracefile():
-    return _parse_tracefile('univ1_pt' + str(TRACE_NUMBER))
+def read_tracefile(stream=False, decode=False):
+    return _parse_tracefile(TRACE_FILE, stream, decode)
 
-def read_test_tracefile():
-    return _parse_tracefile('trace1')
+def read_test_tracefile(stream=False, decode=False):
+    return _parse_tracefile(TEST_TRACE_FILE, stream, decode)
 
-def _parse_tracefile(path):
+# With stream=True, packets are read lazily one at a time instead of loading
+# the whole trace into memory; the result can only be iterated once.
+# With decode=True, packets are streamed as decoder.PacketRecord objects
+# instead of full scapy packets; with pipelined=True as well, they are read
+# and decoded in background threads ahead of the caller, see ingest.py.
+# With decode=True, path can also be a compressed capture or a directory or
+# glob of capture segments, merged in timestamp order by ingest.read_records.
+def _parse_tracefile(path, stream=False, decode=False, pipelined=False):
 	print("> Parsing '" + path +"'")
-	return rdpcap(path)
\ No newline at end of file
+	if decode:
+		if pipelined or not ingest.is_plain_trace(path):
+			return ingest.read_records(path)
+		return decoder.read_records(path)
+	if stream:
+		return _stream_tracefile(path)
+	return rdpcap(path)
+
+# Follow a capture that is still being written (or '-' for stdin); yields
+# lists of decoder.PacketRecord objects, see decoder.follow_batches.
+def follow_tracefile(source, poll_interval=0.1, idle_timeout=None):
+	print("> Following '" + source +"'")
+	return decoder.follow_batches(source, poll_interval, idle_timeout)
+
+def _stream_tracefile(path):
+	with PcapReader(path) as reader:
+		for packet in reader:
+			yield packet
@@ -0,0 +1,209 @@
+import collections
+import csv
+import math
+import os
+import sys
+
+import decoder
+import render
+import rtt
+from flow import flowKey
+from sketch import LogHistogram
+
+# ======================== Windowed Statistics ========================
+# Per-window protocol mix, bytes, new and active flows and RTT percentiles of
+# a trace, computed in one pass over its packets. Windows are width seconds
+# of packet time and start every step seconds: tumbling when step == width,
+# sliding when step divides width. Windows without packets are left out.
+#
+#   python window.py TRACE [--width S] [--step S] [-o OUT.csv]
+#
+# State is kept per step: counters, the set of flows seen and an RTT
+# sketch, for the width / step most recent steps only. Flows are new when
+# they had no packet in the last idle_timeout seconds.
+
+PROTOCOLS = ('TCP', 'UDP', 'ICMP', 'ARP', 'Other')
+PERCENTILES = (50, 90, 99)
+
+FIELDS = (('start', 'end', 'packets', 'bytes') + tuple(p.lower() for p in PROTOCOLS)
+          + ('new_flows', 'active_flows', 'rtt_samples')
+          + tuple('rtt_p%d_ms' % p for p in PERCENTILES))
+
+def _protocol(record):
+    if record.type is not None:
+        return record.type
+    for name, _ in record.layers:
+        if name == 'ICMP' or name == 'ARP':
+            return name
+    return 'Other'
+
+class _Step:
+    __slots__ = ('index', 'packets', 'bytes', 'protocols', 'new_flows', 'flows', 'rtt')
+
+    def __init__(self, index):
+        self.index = index
+        self.packets = 0
+        self.bytes = 0
+        self.protocols = dict((p, 0) for p in PROTOCOLS)
+        self.new_flows = 0
+        self.flows = set()
+        self.rtt = LogHistogram()
+
+class WindowStats:
+    """
+    Streaming per-window statistics; feed it records with add() in capture
+    order, then call finish(). The finished windows are in self.windows, one
+    dict per window with the keys of FIELDS.
+    """
+    def __init__(self, width=10.0, step=None, idle_timeout=300.0):
+        if step is None:
+            step = width
+        self.width = width
+        self.step = step
+        self.steps_per_window = int(round(width / step))
+        if self.steps_per_window < 1 or abs(self.steps_per_window * step - width) > 1e-9 * width:
+            raise ValueError("window width must be a multiple of its step")
+        self.idle_timeout = idle_timeout
+        self.windows = []
+
+        self._steps = collections.deque()
+        # flow keys seen in the current and previous idle_timeout generation
+        self._seen = set()
+        self._seen_before = set()
+        self._rotate_at = None
+        self._rtt = rtt.RttStream(idle_timeout)
+
+    def add(self, records):
+        steps = self._steps
+        step_width = self.step
+        current = steps[-1] if steps else None
+        for record in records:
+            record = decoder.as_record(record)
+            time = record.time
+            index = math.floor(time / step_width)
+            if current is None or index > current.index:
+                current = self._advance(index)
+            # a packet older than the current step (out of order) counts in it
+
+            current.packets += 1
+            current.bytes += record.size
+            current.protocols[_protocol(record)] += 1
+            if record.type is None:
+                continue
+
+            a = (record.src, record.sport)
+            b = (record.dst, record.dport)
+            key = flowKey(record.type, a, b)
+            current.flows.add(key)
+            if self._rotate_at is None or time >= self._rotate_at:
+                if self._rotate_at is not None:
+                    self._seen_before = self._seen
+                    self._seen = set()
+                self._rotate_at = time + self.idle_timeout
+            if not (key in self._seen):
+                if not (key in self._seen_before):
+                    current.new_flows += 1
+                self._seen.add(key)
+
+            if record.type == 'TCP':
+                sample = self._rtt.add(key, 0 if a <= b else 1, record.time_ns, record.flags, record.seq, record.ack,
+                                       record.payload_len)
+                if sample is not None:
+                    current.rtt.append(sample * 1000)
+
+    # Start the step index, emitting the windows that end before it
+    def _advance(self, index):
+        steps = self._steps
+        if steps:
+            last = steps[-1].index
+            # windows ending at each boundary up to index; once the kept steps
+            # have all slid out, the remaining windows of a gap are empty
+            for end in range(last + 1, min(index, last + self.steps_per_window) + 1):
+                self._emit(end)
+            # steps that no window from index on covers
+            while steps and steps[0].index <= index - self.steps_per_window:
+                steps.popleft()
+        step = _Step(index)
+        steps.append(step)
+        return step
+
+    # Emit the window made of the kept steps before step index end
+    def _emit(self, end):
+        steps = [s for s in self._steps if end - self.steps_per_window <= s.index < end]
+        if len(steps) == 0:
+            return
+        window = {'start': (end - self.steps_per_window) * self.step, 'end': end * self.step}
+        window['packets'] = sum(s.packets for s in steps)
+        window['bytes'] = sum(s.bytes for s in steps)
+        for p in PROTOCOLS:
+            window[p.lower()] = sum(s.protocols[p] for s in steps)
+        window['new_flows'] = sum(s.new_flows for s in steps)
+        window['active_flows'] = len(set().union(*(s.flows for s in steps)))
+        sketch = LogHistogram()
+        for s in steps:
+            sketch.merge(s.rtt)
+        window['rtt_samples'] = len(sketch)
+        for p in PERCENTILES:
+            window['rtt_p%d_ms' % p] = sketch.quantile(p / 100) if len(sketch) > 0 else None
+        self.windows.append(window)
+
+    # Emit the windows still open at the end of the trace
+    def finish(self):
+        if self._steps:
+            last = self._steps[-1].index
+            for end in range(last + 1, last + self.steps_per_window + 1):
+                self._emit(end)
+            self._steps.clear()
+        return self.windows
+
+# ======================== Reports ========================
+
+def write_csv(windows, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        writer.writerows(windows)
+    os.replace(tmp, path)
+
+# Plot packets and bytes of every protocol and the new-flow count per window
+def plot_windows(windows, name, width):
+    starts = [w['start'] - windows[0]['start'] for w in windows] if windows else []
+    figure = render.Figure('Packets per ' + str(width) + 's Window', 'Time (s)', 'Packets',
+                           grid=True, labelpad=10, bottom=0.15)
+    for p in PROTOCOLS:
+        figure.plot(starts, [w[p.lower()] for w in windows], p)
+    figure.legend = True
+    figure.save('plots/' + name + '-packets.png')
+    render.submit(figure)
+
+    figure = render.Figure('Bytes per ' + str(width) + 's Window', 'Time (s)', 'Bytes',
+                           grid=True, labelpad=10, bottom=0.15)
+    figure.plot(starts, [w['bytes'] for w in windows], 'All packets')
+    figure.legend = True
+    figure.save('plots/' + name + '-bytes.png')
+    render.submit(figure)
+
+    figure = render.Figure('New Flows per ' + str(width) + 's Window', 'Time (s)', 'Flows',
+                           grid=True, labelpad=10, bottom=0.15)
+    figure.plot(starts, [w['new_flows'] for w in windows], 'New flows')
+    figure.plot(starts, [w['active_flows'] for w in windows], 'Active flows')
+    figure.legend = True
+    figure.save('plots/' + name + '-flows.png')
+    render.submit(figure)
+
+# --width S and --step S of a command line; the step defaults to the width
+def get_window(argv):
+    width = float(argv[argv.index('--width') + 1]) if '--width' in argv else 10.0
+    step = float(argv[argv.index('--step') + 1]) if '--step' in argv else None
+    return width, step
+
+if __name__ == '__main__':
+    import trace_parser as parser
+    path = sys.argv[1]
+    width, step = get_window(sys.argv)
+    output = sys.argv[sys.argv.index('-o') + 1] if '-o' in sys.argv else os.path.basename(path) + '-windows.csv'
+    stats = WindowStats(width, step)
+    stats.add(parser._parse_tracefile(path, decode=True))
+    write_csv(stats.finish(), output)
+    print("> Wrote " + str(len(stats.windows)) + " windows to '" + output + "'")